@@ -1,7 +1,6 @@
 from os import path as ospath, mkdir, system, getenv
 from logging import INFO, ERROR, FileHandler, StreamHandler, basicConfig, getLogger
 from traceback import format_exc
-from asyncio import Queue, Lock
 
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from pyrogram import Client
@@ -27,10 +26,6 @@ ani_cache = {
 }
 ffpids_cache = list()
 
-ffLock = Lock()
-ffQueue = Queue()
-ff_queued = dict()
-
 class Var:
     API_ID, API_HASH, BOT_TOKEN = getenv("API_ID"), getenv("API_HASH"), getenv("BOT_TOKEN")
     MONGO_URI = getenv("MONGO_URI")
@@ -60,6 +55,47 @@ class Var:
     QUALS = getenv("QUALS", "Hdrip 480 720 1080").split()  # Replace 360p with Hdrip, keep others
 
     # Other settings...
+    SEEN_MAX_ITEMS = int(getenv("SEEN_MAX_ITEMS", "5000"))
+    SEEN_MAX_AGE = int(getenv("SEEN_MAX_AGE", "30")) * 86400
+    IO_WORKERS = int(getenv("IO_WORKERS", "0"))
+    CPU_WORKERS = int(getenv("CPU_WORKERS", "0"))
+    CPU_PROCESS_POOL = getenv("CPU_PROCESS_POOL", "False").lower() == "true"
+    ANI_TTL_RELEASING = int(getenv("ANI_TTL_RELEASING", "12")) * 3600
+    ANI_TTL_FINISHED = int(getenv("ANI_TTL_FINISHED", "30")) * 86400
+    ANI_TTL_MISS = int(getenv("ANI_TTL_MISS", "60")) * 60
+    ANI_BATCH_SIZE = int(getenv("ANI_BATCH_SIZE", "10"))
+    ANI_RATE_LIMIT = int(getenv("ANI_RATE_LIMIT", "30"))  # Requests per Minute
+    ANI_RATE_BURST = int(getenv("ANI_RATE_BURST", "5"))
+    HTTP_POOL_SIZE = int(getenv("HTTP_POOL_SIZE", "100"))
+    HTTP_PER_HOST = int(getenv("HTTP_PER_HOST", "10"))
+    HTTP_TIMEOUT = int(getenv("HTTP_TIMEOUT", "120"))
+    HTTP_RETRIES = int(getenv("HTTP_RETRIES", "2"))
+    TORRENT_ACTIVE = int(getenv("TORRENT_ACTIVE", "3"))
+    TORRENT_DL_LIMIT = int(getenv("TORRENT_DL_LIMIT", "0"))  # KiB/s, 0 = Unlimited
+    TORRENT_UL_LIMIT = int(getenv("TORRENT_UL_LIMIT", "0"))
+    TORRENT_PER_DL_LIMIT = int(getenv("TORRENT_PER_DL_LIMIT", "0"))
+    TORRENT_RESUME_INTERVAL = int(getenv("TORRENT_RESUME_INTERVAL", "60"))
+    STREAM_ENCODE = getenv("STREAM_ENCODE", "False").lower() == "true"
+    STREAM_STALL_TIMEOUT = int(getenv("STREAM_STALL_TIMEOUT", "600"))  # Seconds without new data, 0 = Wait Forever
+    MULTI_ENCODE = getenv("MULTI_ENCODE", "False").lower() == "true"
+    ENCODE_SLOTS = int(getenv("ENCODE_SLOTS", "0"))  # 0 = Auto from CPU Count & Free Memory
+    ENCODE_CORES_PER_SLOT = int(getenv("ENCODE_CORES_PER_SLOT", "8"))
+    ENCODE_MEM_PER_SLOT = int(getenv("ENCODE_MEM_PER_SLOT", "2"))  # GiB
+    CHUNK_ENCODE = getenv("CHUNK_ENCODE", "False").lower() == "true"
+    CHUNK_SECONDS = int(getenv("CHUNK_SECONDS", "60"))
+    CHUNK_WORKERS = int(getenv("CHUNK_WORKERS", "0"))  # 0 = Half the CPU Count
+    ENCODE_CACHE_SIZE = int(getenv("ENCODE_CACHE_SIZE", "10"))  # GiB, 0 = Disabled
+    TG_GLOBAL_RATE = int(getenv("TG_GLOBAL_RATE", "30"))  # Bot API Calls per Second
+    TG_RETRIES = int(getenv("TG_RETRIES", "3"))  # FloodWait Retries per Call
+    STATUS_INTERVAL = int(getenv("STATUS_INTERVAL", "10"))  # Seconds between Edits of one Status Message
+    UPLOAD_SESSIONS = int(getenv("UPLOAD_SESSIONS", "4"))  # 0 = Pyrogram's Single Session Upload
+    UPLOAD_WINDOW = int(getenv("UPLOAD_WINDOW", "12"))  # Parts in Flight
+    UPLOAD_RETRIES = int(getenv("UPLOAD_RETRIES", "5"))
+    UPLOAD_QUEUE = int(getenv("UPLOAD_QUEUE", "1"))  # Encoded Tiers Waiting for Upload
+    SEND_ADDONS = getenv("SEND_ADDONS", "False").lower() == "true"  # Screenshots & Sample under each Post
+    SS_COUNT = int(getenv("SS_COUNT", "6"))
+    SAMPLE_DURATION = int(getenv("SAMPLE_DURATION", "30"))  # Seconds, 0 = No Sample
+    SMART_ENCODE = getenv("SMART_ENCODE", "False").lower() == "true"  # Remux / Skip Tiers the Source Already Covers
     
     AS_DOC = getenv("AS_DOC", "True").lower() == "true"
     THUMB = getenv("THUMB", "https://te.legra.ph/file/621c8d40f9788a1db7753.jpg")
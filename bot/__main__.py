@@ -6,9 +6,16 @@ from os import path as ospath, execl, kill
 from sys import executable
 from signal import SIGKILL
 
-from bot import bot, Var, bot_loop, sch, LOGS, ffQueue, ffLock, ffpids_cache, ff_queued
-from bot.core.auto_animes import fetch_animes
-from bot.core.func_utils import clean_up, new_task, editMessage
+from bot import bot, Var, bot_loop, sch, LOGS, ffpids_cache
+from bot.core.auto_animes import fetch_animes, get_animes
+from bot.core.func_utils import clean_up, clean_downloads, new_task, editMessage
+from bot.core.executors import executors
+from bot.core.httpclient import http
+from bot.core.tordownload import torsession
+from bot.core.partupload import uploader
+from bot.core.jobstore import jobstore
+from bot.core.reporter import rep
+from bot.core.seenindex import item_key
 from bot.modules.up_posts import upcoming_animes
 
 @bot.on_message(command('restart') & user(Var.ADMINS))
@@ -17,6 +24,8 @@ async def restart(client, message):
     rmessage = await message.reply('<i>Restarting...</i>')
     if sch.running:
         sch.shutdown(wait=False)
+    await torsession.close()
+    await uploader.close()
     await clean_up()
     if len(ffpids_cache) != 0: 
         for pid in ffpids_cache:
@@ -29,6 +38,7 @@ async def restart(client, message):
     await (await create_subprocess_exec('python3', 'update.py')).wait()
     async with aiopen(".restartmsg", "w") as f:
         await f.write(f"{rmessage.chat.id}\n{rmessage.id}\n")
+    await rep.flush()
     execl(executable, executable, "-m", "bot")
 
 async def restart():
@@ -40,32 +50,35 @@ async def restart():
         except Exception as e:
             LOGS.error(e)
             
-async def queue_loop():
-    LOGS.info("Queue Loop Started !!")
-    while True:
-        if not ffQueue.empty():
-            post_id = await ffQueue.get()
-            await asleep(1.5)
-            ff_queued[post_id].set()
-            await asleep(1.5)
-            async with ffLock:
-                ffQueue.task_done()
-        await asleep(10)
-
 async def main():
     sch.add_job(upcoming_animes, "cron", hour=0, minute=30)
+    await http.start()
     await bot.start()
     await restart()
     LOGS.info('Auto Anime Bot Started!')
     sch.start()
-    bot_loop.create_task(queue_loop())
+    jobs = await jobstore.pending()
+    # Only what an interrupted download or job still points at survives a restart
+    await clean_downloads([*torsession.content_paths(), *(record.get('dl') for record in jobs.values())])
+    for record in jobs.values():
+        LOGS.info(f"Resuming Interrupted Job from {record.get('stage', 'new').title()}: {record['name']}")
+        bot_loop.create_task(get_animes(record['name'], record['link'], resume=record))
+    for job in torsession.pending():
+        if item_key(job['link']) in jobs:
+            continue
+        LOGS.info(f"Resuming Interrupted Download: {job['name']}")
+        bot_loop.create_task(get_animes(job['name'], job['link']))
     await fetch_animes()
     await idle()
     LOGS.info('Auto Anime Bot Stopped!')
+    await uploader.close()
     await bot.stop()
+    await http.close()
+    await torsession.close()
     for task in all_tasks:
         task.cancel()
     await clean_up()
+    executors.shutdown()
     LOGS.info('Finished AutoCleanUp !!')
     
 if __name__ == '__main__':
@@ -0,0 +1,70 @@
+from os import path as ospath, makedirs
+from asyncio import gather, create_subprocess_exec, sleep as asleep
+from asyncio.subprocess import PIPE
+from traceback import format_exc
+
+from aioshutil import rmtree as aiormtree
+from pyrogram.types import InputMediaPhoto, InputMediaVideo
+
+from bot import bot, Var, LOGS
+from .func_utils import sync_to_async, convertTime
+from .artifacts import link_or_copy
+from .mediaprobe import probe
+from .reporter import rep
+from .tgdispatch import tgd, LOW
+
+async def run_ffmpeg(*args):
+    proc = await create_subprocess_exec("ffmpeg", "-hide_banner", "-v", "error", *args, "-y", stdout=PIPE, stderr=PIPE)
+    _, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        LOGS.error(f"FFmpeg Add-on Failed: {stderr.decode().strip()[-500:]}")
+    return proc.returncode == 0
+
+async def take_screenshots(src, out_dir, count, duration):
+    """Grabs count frames spread over the episode, each seeking on the input side so only one GOP gets decoded"""
+    stamps = [duration * (i + 1) / (count + 1) for i in range(count)]
+    paths = [ospath.join(out_dir, f"ss{i + 1:02d}.jpg") for i in range(count)]
+    done = await gather(*(run_ffmpeg("-ss", f"{ts:.3f}", "-i", src, "-map", "0:v:0", "-frames:v", "1", "-q:v", "2", path)
+                          for ts, path in zip(stamps, paths)))
+    return [path for path, ok in zip(paths, done) if ok and ospath.exists(path)]
+
+async def cut_sample(src, out_path, start, length):
+    """Stream copies length seconds from the keyframe nearest to start, no re-encoding"""
+    if await run_ffmpeg("-ss", f"{start:.3f}", "-i", src, "-t", str(length), "-map", "0:v:0", "-map", "0:a:0?",
+                        "-c", "copy", "-movflags", "+faststart", out_path) and ospath.exists(out_path):
+        return out_path
+
+class AddOns:
+    """Screenshots and a sample clip for one episode, generated after upload from a staged copy of the output"""
+    def __init__(self, post_id, root="addons"):
+        self.post_id = post_id
+        self.__dir = ospath.join(root, str(post_id))
+        self.__src = None
+
+    async def stage(self, path):
+        # Hardlinked so the uploader and workspace cleanup can drop their copy while the add-ons still run
+        makedirs(self.__dir, exist_ok=True)
+        self.__src = ospath.join(self.__dir, "source" + ospath.splitext(path)[1])
+        await sync_to_async(link_or_copy, path, self.__src)
+        return self
+
+    async def run(self):
+        try:
+            if not (info := await probe(self.__src)) or not info.duration:
+                return
+            start = info.duration / 5
+            shots, sample = await gather(
+                take_screenshots(self.__src, self.__dir, Var.SS_COUNT, info.duration) if Var.SS_COUNT else asleep(0, []),
+                cut_sample(self.__src, ospath.join(self.__dir, "sample.mp4"), start, min(Var.SAMPLE_DURATION, info.duration - start)) if Var.SAMPLE_DURATION else asleep(0),
+            )
+            media = [InputMediaPhoto(shot) for shot in shots]
+            if sample:
+                media.append(InputMediaVideo(sample, supports_streaming=True))
+            if not (media := media[-10:]):
+                return
+            media[0].caption = f"<i>Screenshots & Sample • {convertTime(info.duration)}</i>"
+            await tgd.call(Var.MAIN_CHANNEL, bot.send_media_group, Var.MAIN_CHANNEL, media, reply_to_message_id=self.post_id, priority=LOW)
+        except Exception:
+            await rep.report(format_exc(), "error")
+        finally:
+            await aiormtree(self.__dir, ignore_errors=True)
@@ -0,0 +1,82 @@
+from re import sub
+from time import time
+from collections import OrderedDict
+from traceback import format_exc
+
+from bot import Var, LOGS
+from .database import db
+
+MISS = {'miss': True}
+
+def search_key(name, season=None, year=None):
+    name = sub(r"\s+", " ", (name or "").lower()).strip()
+    return f"search:{name}|{season or ''}|{year or ''}"
+
+def id_key(ani_id):
+    return f"id:{ani_id}"
+
+class AniCache:
+    def __init__(self, max_items=1024):
+        self.__max_items = max_items
+        self.__lru = OrderedDict()
+
+    def __ttl(self, data):
+        if data is MISS or not data:
+            return Var.ANI_TTL_MISS
+        if data.get('status') in ("FINISHED", "CANCELLED"):
+            return Var.ANI_TTL_FINISHED
+        return Var.ANI_TTL_RELEASING
+
+    def __remember(self, key, data, expires):
+        self.__lru[key] = (expires, data)
+        self.__lru.move_to_end(key)
+        while len(self.__lru) > self.__max_items:
+            self.__lru.popitem(last=False)
+
+    async def __get(self, key):
+        if (entry := self.__lru.get(key)):
+            if entry[0] > time():
+                self.__lru.move_to_end(key)
+                return entry[1]
+            del self.__lru[key]
+        try:
+            doc = await db.getAniCache(key)
+        except Exception:
+            LOGS.error(format_exc())
+            return None
+        if doc and doc.get('expires', 0) > time():
+            self.__remember(key, doc['data'], doc['expires'])
+            return doc['data']
+        return None
+
+    async def __set(self, key, data, ttl):
+        expires = time() + ttl
+        self.__remember(key, data, expires)
+        try:
+            await db.saveAniCache(key, data, expires)
+        except Exception:
+            LOGS.error(format_exc())
+
+    async def get_id(self, ani_id):
+        return await self.__get(id_key(ani_id))
+
+    async def set_id(self, data):
+        if data and data.get('id'):
+            await self.__set(id_key(data['id']), data, self.__ttl(data))
+
+    async def get_search(self, key):
+        """Returns None if unknown, {} for a cached miss, else the AniList media data"""
+        if (ref := await self.__get(key)) is None:
+            return None
+        if ref.get('miss'):
+            return {}
+        return await self.get_id(ref.get('id'))
+
+    async def set_search(self, key, data):
+        if data and data.get('id'):
+            await self.set_id(data)
+            await self.__set(key, {'id': data['id']}, self.__ttl(data))
+        else:
+            await self.__set(key, MISS, self.__ttl(MISS))
+
+anicache = AniCache()
@@ -0,0 +1,58 @@
+from os import path as ospath, link, makedirs
+from shutil import copyfile
+
+from aiofiles.os import remove as aioremove
+
+from bot import LOGS
+from .func_utils import sync_to_async
+
+def link_or_copy(src, dest):
+    try:
+        link(src, dest)
+    except OSError:
+        copyfile(src, dest)
+
+class SourceArtifact:
+    """A downloaded file shared by every consumer of a job, each one reads it through its own hardlink
+    and the original path is removed once the last reference is released"""
+    def __init__(self, store, path):
+        self.path = path
+        self.refs = 0
+        self.__store = store
+
+    def acquire(self):
+        self.refs += 1
+        return self
+
+    async def release(self):
+        self.refs -= 1
+        if self.refs > 0:
+            return
+        self.__store.drop(self)
+        try:
+            if ospath.exists(self.path):
+                await aioremove(self.path)
+        except Exception as e:
+            LOGS.error(f"Source Cleanup Failed: {e}")
+
+    async def link(self, dest):
+        """Exposes the source at dest without copying, an existing link is reused"""
+        if not ospath.exists(dest):
+            makedirs(ospath.dirname(dest) or ".", exist_ok=True)
+            await sync_to_async(link_or_copy, self.path, dest)
+        return dest
+
+class ArtifactStore:
+    def __init__(self):
+        self.__items = {}
+
+    def get(self, path):
+        key = ospath.realpath(path)
+        if (artifact := self.__items.get(key)) is None:
+            artifact = self.__items[key] = SourceArtifact(self, path)
+        return artifact
+
+    def drop(self, artifact):
+        self.__items.pop(ospath.realpath(artifact.path), None)
+
+artifacts = ArtifactStore()
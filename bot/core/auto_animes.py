@@ -1,21 +1,32 @@
-from asyncio import gather, create_task, sleep as asleep, Event
+from asyncio import Queue, wait, create_task, FIRST_COMPLETED, sleep as asleep
 from asyncio.subprocess import PIPE
-from os import path as ospath, system
+from os import path as ospath
 from aiofiles import open as aiopen
-from aiofiles.os import remove as aioremove
 from traceback import format_exc
 from base64 import urlsafe_b64encode
 from time import time
+from math import floor
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
-from bot import bot, bot_loop, Var, ani_cache, ffQueue, ffLock, ff_queued
-from .tordownload import TorDownloader
+from bot import bot, bot_loop, Var, ani_cache
+from .tordownload import TorDownloader, PieceReader
 from .database import db
-from .func_utils import getfeed, encode, editMessage, sendMessage, convertBytes
+from .func_utils import encode, editMessage, sendMessage, convertBytes, convertTime, sync_to_async
+from .feedpoller import FeedPoller
+from .seenindex import seen, item_key
 from .text_utils import TextEditor
-from .ffencoder import FFEncoder
+from .ffencoder import FFEncoder, ffprofiles
+from .encplanner import plan_encodes
+from .mediaprobe import probe
+from .encpool import encpool
 from .tguploader import TgUploader
+from .addons import AddOns
+from .artifacts import artifacts, link_or_copy
+from .statusedit import status
+from .jobstate import JobState, live_jobs
+from .jobstore import jobstore
 from .reporter import rep
+from .tgdispatch import tgd, LOW
 
 btn_formatter = {
     '1080': '𝟭𝟬𝟴𝟬𝗽',
@@ -26,14 +37,17 @@ btn_formatter = {
 
 async def fetch_animes():
     await rep.report("Fetch Animes Started !!", "info")
+    poller = FeedPoller()
     while True:
         await asleep(60)
         if ani_cache['fetch_animes']:
-            for link in Var.RSS_ITEMS:
-                if (info := await getfeed(link, 0)):
-                    bot_loop.create_task(get_animes(info.title, info.link))
+            for info in await poller.poll():
+                if info.link in seen:
+                    continue
+                bot_loop.create_task(get_animes(info.title, info.link))
 
-async def get_animes(name, torrent, force=False):
+async def get_animes(name, torrent, force=False, resume=None):
+    job, source, stat_msg, dler, tjob = None, None, None, None, None
     try:
         aniInfo = TextEditor(name)
         await aniInfo.load_anilist()
@@ -41,125 +55,297 @@ async def get_animes(name, torrent, force=False):
 
         if ani_id not in ani_cache['ongoing']:
             ani_cache['ongoing'].add(ani_id)
-        elif not force:
+        elif not force and not resume:
             return
 
-        if not force and ani_id in ani_cache['completed']:
+        if not force and not resume and ani_id in ani_cache['completed']:
             return
 
-        if force or (not (ani_data := await db.getAnime(ani_id)) or 
+        if force or resume or (not (ani_data := await db.getAnime(ani_id)) or 
             (ani_data and not (qual_data := ani_data.get(ep_no))) or 
             (ani_data and qual_data and not all(qual for qual in qual_data.values()))):
 
-            if "[Batch]" in name:
+            if "[Batch]" in name and not resume:
                 await rep.report(f"Torrent Skipped!\n\n{name}", "warning")
+                await seen.add(torrent)
                 return
 
-            await rep.report(f"New Anime Torrent Found!\n\n{name}", "info")
-            post_msg = await bot.send_photo(
-                Var.MAIN_CHANNEL,
-                photo=await aniInfo.get_poster(),
-                caption=await aniInfo.get_caption()
-            )
-
-            await asleep(1.5)
-            stat_msg = await sendMessage(Var.MAIN_CHANNEL, f"‣ <b>Anime Name :</b> <b><i>{name}</i></b>\n\n<i>Downloading...</i>")
-
-            dl = await TorDownloader("./downloads").download(torrent, name)
-            if not dl or not ospath.exists(dl):
-                await rep.report(f"File Download Incomplete, Try Again", "error")
-                await stat_msg.delete()
+            if item_key(torrent) in live_jobs:
+                # One durable record per release, a second run would overwrite its checkpoints
+                await rep.report(f"Anime Job Already Running, Skipped!\n\n{name}", "warning")
                 return
 
-            post_id = post_msg.id
-            ffEvent = Event()
-            ff_queued[post_id] = ffEvent
+            # Every stage transition is checkpointed, a restarted bot picks the job up where it stopped
+            if resume:
+                job = JobState.restore(item_key(torrent), resume).register()
+            else:
+                job = JobState(item_key(torrent), name, Var.QUALS, ani_id, ep_no, torrent).register()
+            post_msg = None
+            if job.post_id:
+                post_msg = await bot.get_messages(Var.MAIN_CHANNEL, job.post_id)
+                if not post_msg or post_msg.empty:
+                    post_msg = None
+                else:
+                    await rep.report(f"Resuming Anime Job from {job.stage.title()}!\n\n{name}", "info")
+            if post_msg is None:
+                await rep.report(f"New Anime Torrent Found!\n\n{name}", "info")
+                post_msg = await tgd.call(
+                    Var.MAIN_CHANNEL,
+                    bot.send_photo,
+                    Var.MAIN_CHANNEL,
+                    photo=await aniInfo.get_poster(),
+                    caption=await aniInfo.get_caption()
+                )
+                job.post_id, job.stage = post_msg.id, 'posted'
+                await jobstore.checkpoint(job)
+                await asleep(1.5)
+
+            # A resumed job keeps its status message instead of leaving the old one behind
+            if job.stat_id:
+                stat_msg = await bot.get_messages(Var.MAIN_CHANNEL, job.stat_id)
+                if not stat_msg or stat_msg.empty:
+                    stat_msg = None
+                else:
+                    await status.update(stat_msg, f"‣ <b>Anime Name :</b> <b><i>{name}</i></b>\n\n<i>Resuming...</i>", final=True)
+            if stat_msg is None:
+                stat_msg = await sendMessage(Var.MAIN_CHANNEL, f"‣ <b>Anime Name :</b> <b><i>{name}</i></b>\n\n<i>Downloading...</i>")
+                job.stat_id = getattr(stat_msg, 'id', None)
+                await jobstore.checkpoint(job)
+
+            dler, tjob, stream = TorDownloader("./downloads"), None, None
+            if job.dl and ospath.exists(job.dl):
+                # Downloaded before the restart
+                dl = job.dl
+                source = artifacts.get(dl).acquire()
+            elif Var.STREAM_ENCODE and not Var.CHUNK_ENCODE:
+                # Fetch pieces in order and start encoding while the rest is still downloading
+                if not (tjob := await dler.start(torrent, name, dl_progress(stat_msg, name), sequential=True)):
+                    await rep.report(f"File Download Failed to Start, Try Again", "error")
+                    await status.close(stat_msg)
+                    await jobstore.remove(job)
+                    return
+                stream = await PieceReader(tjob).open()
+                dl = stream.path
+                source = artifacts.get(dl).acquire()
+            else:
+                dl = await dler.download(torrent, name, dl_progress(stat_msg, name))
+                if not dl or not ospath.exists(dl):
+                    await rep.report(f"File Download Incomplete, Try Again", "error")
+                    await status.close(stat_msg)
+                    await jobstore.remove(job)
+                    return
+                source = artifacts.get(dl).acquire()
+                job.dl, job.stage = dl, 'downloaded'
+                await jobstore.checkpoint(job)
 
-            if ffLock.locked():
-                await editMessage(stat_msg, f"‣ <b>Anime Name :</b> <b><i>{name}</i></b>\n\n<i>Queued to Encode...</i>")
+            post_id = post_msg.id
+            if encpool.locked():
+                await status.update(stat_msg, f"‣ <b>Anime Name :</b> <b><i>{name}</i></b>\n\n<i>Queued to Encode...</i>", final=True)
                 await rep.report("Added Task to Queue...", "info")
 
-            await ffQueue.put(post_id)
-            await ffEvent.wait()
-            await ffLock.acquire()
-
-            btns = []
-            for qual in Var.QUALS:
-                filename = await aniInfo.get_upname(qual)
-
-                try:
-                    # **HDRip Handling**
-                    if qual.lower() == 'hdri':  
-                        renamed_path = f"./downloads/{filename.replace('Hdri', 'Hdrip').replace('Hdripp', 'Hdrip')}"
-
-                        # Ensure the original file exists before renaming
-                        if ospath.exists(dl):
-                            system(f'mv "{dl}" "{renamed_path}"')
-                        else:
-                            await rep.report(f"Error: File not found before renaming: {dl}", "error")
-                            return
-
-                        # Check if renaming was successful
-                        if not ospath.exists(renamed_path):
-                            await rep.report(f"Error: File renaming failed. {renamed_path} not found!", "error")
-                            return
-
-                        await editMessage(stat_msg, f"‣ <b>Anime Name :</b> <b><i>{name}</i></b>\n\n<i>Ready to Upload...</i>")
-                        await asleep(1.5)
-
-                        # Use the correct renamed path
-                        msg = await TgUploader(stat_msg).upload(renamed_path, qual)
-                        out_path = renamed_path  
-
-                    else:
-                        await editMessage(stat_msg, f"‣ <b>Anime Name :</b> <b><i>{name}</i></b>\n\n<i>Ready to Encode...</i>")
-                        await asleep(1.5)
-                        await rep.report("Starting Encode...", "info")
-
-                        out_path = await FFEncoder(stat_msg, dl, filename, qual).start_encode()
-
-                    await rep.report("Successfully Processed, Now Uploading...", "info")
-                    await editMessage(stat_msg, f"‣ <b>Anime Name :</b> <b><i>{filename}</i></b>\n\n<i>Ready to Upload...</i>")
-                    await asleep(1.5)
-
-                    msg = await TgUploader(stat_msg).upload(out_path, qual)
-
-                    await rep.report("Successfully Uploaded File into Telegram...", "info")
-                    msg_id = msg.id
-                    link = f"https://telegram.me/{(await bot.get_me()).username}?start={await encode('get-'+str(msg_id * abs(Var.FILE_STORE)))}"
-
-                    # Updating post with download links
-                    if post_msg:
-                        if len(btns) != 0 and len(btns[-1]) == 1:
-                            btns[-1].insert(1, InlineKeyboardButton(f"{btn_formatter[qual]} - {convertBytes(msg.document.file_size)}", url=link))
-                        else:
-                            btns.append([InlineKeyboardButton(f"{btn_formatter[qual]} - {convertBytes(msg.document.file_size)}", url=link)])
-                        await editMessage(post_msg, post_msg.caption.html if post_msg.caption else "", InlineKeyboardMarkup(btns))
-
-                    await db.saveAnime(ani_id, ep_no, qual, post_id)
-
-                    # Run additional utilities asynchronously
-                    bot_loop.create_task(extra_utils(msg_id, out_path))
-
-                except Exception as e:
-                    await rep.report(f"Error: {e}, Cancelled, Retry Again!", "error")
-                    await stat_msg.delete()
-                    ffLock.release()
-                    return
-
-            ffLock.release()
-            await stat_msg.delete()
-            await aioremove(dl)
+            uploads = None
+            try:
+                async with encpool.slot(post_id) as workspace:
+                    quals = [q for q in job.tiers if not job[q].finished]
+                    if stream:
+                        quals.sort(key=lambda q: q.lower() == 'hdri')
+                    multi_outs, plans = None, {}
+                    if Var.SMART_ENCODE and not stream:
+                        plans = plan_encodes(await probe(dl), [q for q in quals if job[q].stage == 'pending'])
+                        for qual in [q for q, plan in plans.items() if plan.action == 'skip']:
+                            # Tier is above the source resolution, nothing to upload for it
+                            await rep.report(f"Skipped {qual}p Tier, Source is Lower Resolution", "info")
+                            job[qual].enter('skipped')
+                            await db.saveAnime(ani_id, ep_no, qual)
+                            await jobstore.checkpoint(job)
+                        quals = [q for q in quals if not job[q].finished]
+                    # Add-ons are cut from the last tier, which is the best one left
+                    addon_qual = quals[-1] if Var.SEND_ADDONS and quals else None
+                    # Encoded tiers wait here for the uploader, a full queue holds the encoder back
+                    upq, uploaded = Queue(maxsize=max(1, Var.UPLOAD_QUEUE)), {}
+                    for tier in job.tiers.values():
+                        if tier.stage == 'uploaded' and tier.msg_id:
+                            uploaded[tier.qual] = InlineKeyboardButton(f"{btn_formatter[tier.qual]} - {convertBytes(tier.size)}", url=await file_link(tier.msg_id))
+                    workdir = jobstore.workdir(job)
+
+                    async def encode_stage():
+                        nonlocal dl, tjob, stream, multi_outs
+                        for qual in quals:
+                            tier = job[qual]
+                            if tier.stage == 'encoded':
+                                # Encoded before the restart, straight to the uploader
+                                await upq.put(qual)
+                                continue
+                            tier.enter('encoding')
+                            tier.filename = filename = await aniInfo.get_upname(qual)
+                            use_stream = stream is not None and qual.lower() != 'hdri'
+                            if tjob and not use_stream:
+                                dl, tjob = await dler.finish(tjob), None
+                                if not dl or not ospath.exists(dl):
+                                    raise FileNotFoundError("File Download Incomplete")
+                                job.dl, job.stage = dl, 'downloaded'
+                                await jobstore.checkpoint(job)
+
+                            # **HDRip Handling**, the source is uploaded as is through a hardlink under its release name
+                            if qual.lower() == 'hdri':
+                                out_path = await source.link(ospath.join(workspace, filename.replace('Hdri', 'Hdrip').replace('Hdripp', 'Hdrip')))
+
+                            else:
+                                await status.update(stat_msg, f"‣ <b>Anime Name :</b> <b><i>{name}</i></b>\n\n<i>Ready to Encode...</i>")
+                                await rep.report("Starting Encode...", "info")
+
+                                if (plan := plans.get(qual)) and plan.copies:
+                                    out_path = await FFEncoder(stat_msg, dl, filename, qual, None, workspace, dler.info_hash).start_encode(plan)
+                                elif Var.MULTI_ENCODE and qual in ffprofiles:
+                                    # Decode once, every remaining tier is produced by the same ffmpeg run
+                                    if multi_outs is None:
+                                        mnames = {q: await aniInfo.get_upname(q) for q in quals if q in ffprofiles and job[q].stage in ('pending', 'encoding') and not (q in plans and plans[q].copies)}
+                                        multi_outs = await FFEncoder(stat_msg, dl, name, "multi", stream if use_stream else None, workspace, dler.info_hash).start_multi_encode(mnames)
+                                    out_path = multi_outs.get(qual)
+                                elif Var.CHUNK_ENCODE and qual in ffprofiles:
+                                    out_path = await FFEncoder(stat_msg, dl, filename, qual, None, workspace, dler.info_hash).start_chunked_encode()
+                                else:
+                                    out_path = await FFEncoder(stat_msg, dl, filename, qual, stream if use_stream else None, workspace, dler.info_hash).start_encode()
+                                if use_stream:
+                                    stream = None
+
+                            if not out_path or not ospath.exists(out_path):
+                                raise RuntimeError(f"Encoding {qual} Produced No Output")
+                            await rep.report(f"Successfully Processed {qual}, Queued for Upload...", "info")
+                            # Kept in the job dir so the output outlives the workspace if the bot restarts before upload
+                            kept = ospath.join(workdir, ospath.basename(out_path))
+                            if not ospath.exists(kept):
+                                await sync_to_async(link_or_copy, out_path, kept)
+                            tier.out_path = out_path = kept
+                            tier.size = ospath.getsize(out_path)
+                            tier.enter('encoded')
+                            await jobstore.checkpoint(job)
+                            started = time()
+                            await upq.put(qual)
+                            job.blocked['encode'] += time() - started
+                        await upq.put(None)
+
+                    async def upload_stage():
+                        while True:
+                            started = time()
+                            qual = await upq.get()
+                            job.blocked['upload'] += time() - started
+                            if qual is None:
+                                return
+                            tier, out_path = job[qual], job[qual].out_path
+                            addons = await AddOns(post_id).stage(out_path) if qual == addon_qual and out_path else None
+                            msg = await TgUploader(stat_msg, job).upload(out_path, qual)
+
+                            await rep.report("Successfully Uploaded File into Telegram...", "info")
+                            tier.msg_id = msg_id = msg.id
+                            # Recorded before anything else, a restart from here on must not upload the tier again
+                            await jobstore.checkpoint(job)
+                            link = await file_link(msg_id)
+
+                            # Updating post with download links, always laid out in tier order
+                            uploaded[qual] = InlineKeyboardButton(f"{btn_formatter[qual]} - {convertBytes(msg.document.file_size)}", url=link)
+                            if post_msg:
+                                await editMessage(post_msg, post_msg.caption.html if post_msg.caption else "", InlineKeyboardMarkup(build_btns(list(job.tiers), uploaded)))
+
+                            await db.saveAnime(ani_id, ep_no, qual, post_id)
+
+                            # Run additional utilities asynchronously
+                            bot_loop.create_task(extra_utils(msg_id, out_path, addons))
+
+                    uploads, encodes = create_task(upload_stage()), create_task(encode_stage())
+                    try:
+                        # A failed upload stops the encoder as well, it would block on the full queue otherwise
+                        await wait([encodes, uploads], return_when=FIRST_COMPLETED)
+                        if not encodes.done():
+                            encodes.cancel()
+                            uploads.result()
+                            raise RuntimeError("Upload Stage Ended Before Encoding")
+                        encodes.result()
+                    except BaseException:
+                        encodes.cancel()
+                        uploads.cancel()
+                        raise
+                # Every output is in the job dir by now, the slot goes to the next episode while the rest uploads
+                await uploads
+            except Exception as e:
+                if uploads:
+                    uploads.cancel()
+                for tier in job.tiers.values():
+                    if tier.stage in ('encoding', 'encoded', 'uploading'):
+                        tier.enter('failed')
+                job.unregister()
+                await rep.report(f"Error: {e}, Cancelled, Retry Again!", "error")
+                if tjob:
+                    # A streamed torrent still downloading must not be resumed as a new job on next start
+                    dler.cancel(tjob)
+                    tjob = None
+                await status.close(stat_msg)
+                await source.release()
+                source = None
+                await jobstore.remove(job)
+                return
+            job.unregister()
+            await rep.report(f"Pipeline Timings for {name}\n\nEncode : {convertTime(job.spent('encoding'))} (Blocked on Upload {convertTime(job.blocked['encode'])})\nUpload : {convertTime(job.spent('uploading'))} (Idle {convertTime(job.blocked['upload'])})", "info")
+
+            await status.close(stat_msg)
+            if tjob:
+                await dler.finish(tjob)
+            await source.release()
+            source = None
+            await jobstore.remove(job)
             ani_cache['completed'].add(ani_id)
+            await seen.add(torrent)
+
+        else:
+            if resume:
+                await jobstore.remove(JobState.restore(item_key(torrent), resume))
+            await seen.add(torrent)
 
     except Exception as error:
         await rep.report(format_exc(), "error")
-
-async def extra_utils(msg_id, out_path):
+        if source:
+            # Whatever failed after the download, the source must not outlive the job
+            await source.release()
+        if tjob:
+            dler.cancel(tjob)
+        if getattr(stat_msg, 'id', None):
+            await status.close(stat_msg)
+        if job:
+            job.unregister()
+            await jobstore.remove(job)
+
+async def file_link(msg_id):
+    return f"https://telegram.me/{(await bot.get_me()).username}?start={await encode('get-'+str(msg_id * abs(Var.FILE_STORE)))}"
+
+def build_btns(quals, uploaded):
+    """Two buttons per row in tier order, whichever order the uploads finished in"""
+    btns = [uploaded[qual] for qual in quals if qual in uploaded]
+    return [btns[i:i + 2] for i in range(0, len(btns), 2)]
+
+def dl_progress(stat_msg, name):
+    async def progress(dl):
+        percent = dl['progress']
+        bar = floor(percent / 8) * "█" + (12 - floor(percent / 8)) * "▒"
+        eta = (dl['total'] - dl['done']) / dl['speed'] if dl['speed'] else 0
+        await status.update(stat_msg, f"""‣ <b>Anime Name :</b> <b><i>{name}</i></b>
+
+‣ <b>Status :</b> <i>Downloading</i>
+    <code>[{bar}]</code> {percent}%
+    
+    ‣ <b>Size :</b> {convertBytes(dl['done'])} out of ~ {convertBytes(dl['total'])}
+    ‣ <b>Speed :</b> {convertBytes(dl['speed'])}/s
+    ‣ <b>Peers :</b> {dl['peers']} ({dl['seeds']} Seeds)
+    ‣ <b>Time Took :</b> {convertTime(dl['elapsed'])}
+    ‣ <b>Time Left :</b> {convertTime(eta)}""")
+    return progress
+
+async def extra_utils(msg_id, out_path, addons=None):
     msg = await bot.get_messages(Var.FILE_STORE, message_ids=msg_id)
 
     if Var.BACKUP_CHANNEL != 0:
         for chat_id in Var.BACKUP_CHANNEL.split():
-            await msg.copy(int(chat_id))
+            await tgd.call(int(chat_id), msg.copy, int(chat_id), priority=LOW)
 
-    # MediaInfo, ScreenShots, Sample Video ( Add-ons Features )
\ No newline at end of file
+    # ScreenShots & Sample Video ( Add-ons Features ), off the encode / upload path
+    if addons:
+        await addons.run()
\ No newline at end of file
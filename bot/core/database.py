@@ -6,6 +6,8 @@ class MongoDB:
         self.__client = AsyncIOMotorClient(uri)
         self.__db = self.__client[database_name]
         self.__animes = self.__db.animes[Var.BOT_TOKEN.split(':')[0]]
+        self.__anicache = self.__db.anicache
+        self.__jobs = self.__db.jobs[Var.BOT_TOKEN.split(':')[0]]
 
     async def getAnime(self, ani_id):
         botset = await self.__animes.find_one({'_id': ani_id})
@@ -18,6 +20,21 @@ class MongoDB:
         if post_id:
             await self.__animes.update_one({'_id': ani_id}, {'$set': {"msg_id": post_id}}, upsert=True)
 
+    async def getAniCache(self, key):
+        return await self.__anicache.find_one({'_id': key})
+
+    async def saveAniCache(self, key, data, expires):
+        await self.__anicache.update_one({'_id': key}, {'$set': {'data': data, 'expires': expires}}, upsert=True)
+
+    async def getJobs(self):
+        return [job async for job in self.__jobs.find({})]
+
+    async def saveJob(self, key, data):
+        await self.__jobs.update_one({'_id': key}, {'$set': data}, upsert=True)
+
+    async def delJob(self, key):
+        await self.__jobs.delete_one({'_id': key})
+
     async def reboot(self):
         await self.__animes.drop()
 
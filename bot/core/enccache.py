@@ -0,0 +1,72 @@
+from os import path as ospath, makedirs, listdir, remove, utime, stat
+from hashlib import sha256
+
+from bot import Var, LOGS
+from .func_utils import sync_to_async
+from .artifacts import link_or_copy
+
+def file_digest(path, chunk_size=4 << 20):
+    digest = sha256()
+    with open(path, 'rb') as f:
+        while (chunk := f.read(chunk_size)):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class EncodeCache:
+    """Encoded outputs on disk keyed by source content + ffmpeg command, evicted least recently used first"""
+    def __init__(self, root="cache/encodes", max_bytes=0):
+        self.__root = root
+        self.__max_bytes = max_bytes
+        if self.enabled:
+            makedirs(root, exist_ok=True)
+
+    @property
+    def enabled(self):
+        return self.__max_bytes > 0
+
+    async def source_key(self, path, info_hash=None):
+        if info_hash:
+            return f"btih:{info_hash}"
+        return f"sha256:{await sync_to_async(file_digest, path)}"
+
+    @staticmethod
+    def key(source_key, ffcode):
+        return sha256(f"{source_key}\0{ffcode}".encode()).hexdigest()
+
+    def __entry(self, key):
+        return ospath.join(self.__root, f"{key}.mkv")
+
+    async def fetch(self, key, dest):
+        if not self.enabled or not ospath.exists(entry := self.__entry(key)):
+            return False
+        utime(entry)
+        await sync_to_async(link_or_copy, entry, dest)
+        LOGS.info(f"Encode Cache Hit: {ospath.basename(dest)}")
+        return True
+
+    async def store(self, key, path):
+        if not self.enabled or not ospath.exists(path):
+            return
+        entry = self.__entry(key)
+        if ospath.exists(entry):
+            remove(entry)
+        try:
+            await sync_to_async(link_or_copy, path, entry)
+        except Exception as e:
+            LOGS.error(f"Encode Cache Store Failed: {e}")
+            return
+        await sync_to_async(self.__evict)
+
+    def __evict(self):
+        entries = []
+        for name in listdir(self.__root):
+            st = stat(ospath.join(self.__root, name))
+            entries.append((st.st_mtime, st.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.__max_bytes:
+                break
+            remove(ospath.join(self.__root, name))
+            total -= size
+
+enccache = EncodeCache(max_bytes=Var.ENCODE_CACHE_SIZE * 1024 ** 3)
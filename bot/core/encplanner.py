@@ -0,0 +1,77 @@
+from .ffencoder import ffprofiles, profile_vargs, profile_aargs
+
+# Source properties a tier output can keep without re-encoding, codecs are matched against the FFCODE_* targets
+COPY_PIX_FMTS = {'yuv420p'}
+CODEC_NAMES = {'libx264': 'h264', 'libx265': 'hevc', 'libsvtav1': 'av1', 'libaom-av1': 'av1', 'libopus': 'opus', 'libfdk_aac': 'aac'}
+
+def target_codec(args, opts):
+    for opt, value in zip(args, args[1:]):
+        if opt in opts:
+            return CODEC_NAMES.get(value, value)
+
+def tier_size(qual):
+    width, _, height = ffprofiles[qual]['scale'].partition(":")
+    return int(width), int(height)
+
+class EncodePlan:
+    """What one tier needs from a probed source: skip it, remux it, or re-encode only the streams that differ"""
+    __slots__ = ('qual', 'action', 'copy_video', 'copy_audio')
+
+    def __init__(self, qual, action, copy_video=False, copy_audio=False):
+        self.qual = qual
+        self.action = action
+        self.copy_video = copy_video
+        self.copy_audio = copy_audio
+
+    def vargs(self):
+        if self.copy_video:
+            return ["-c:v", "copy"]
+        return ["-vf", f"scale={ffprofiles[self.qual]['scale']}", *profile_vargs(self.qual)]
+
+    def aargs(self):
+        if self.copy_audio:
+            return ["-c:a", "copy", "-c:s", "copy"]
+        return profile_aargs(self.qual)
+
+    def margs(self):
+        return list(ffprofiles[self.qual]['meta'])
+
+    @property
+    def copies(self):
+        return self.copy_video or self.copy_audio
+
+    @property
+    def code(self):
+        """Path independent description of the plan, used for output cache keys"""
+        return " ".join(["plan", self.action, *self.vargs(), *self.aargs(), *self.margs()])
+
+    def ffargs(self, in_path, prog_file, out_path):
+        return ["ffmpeg", "-hide_banner", "-i", in_path, "-progress", prog_file, "-map", "0",
+                *self.vargs(), *self.aargs(), *self.margs(), out_path, "-y"]
+
+    def __repr__(self):
+        return f"EncodePlan({self.qual}: {self.action})"
+
+def plan_encodes(info, quals):
+    """Returns {qual: EncodePlan} for every profile tier in quals, tiers without a profile are left out"""
+    tiers = [q for q in quals if q in ffprofiles]
+    if not info or not info.width or not info.height or not tiers:
+        return {q: EncodePlan(q, 'encode') for q in tiers}
+
+    acodecs = {q: target_codec(profile_aargs(q), ('-c:a', '-acodec', '-codec:a')) for q in tiers}
+    vcodecs = {q: target_codec(profile_vargs(q), ('-c:v', '-vcodec', '-codec:v')) for q in tiers}
+    # Never upscale, but always keep the smallest tier so a low resolution source still gets an output
+    smallest = min(tiers, key=lambda q: tier_size(q)[1])
+
+    plans = {}
+    for qual in tiers:
+        width, height = tier_size(qual)
+        if info.width < width and info.height < height and qual != smallest:
+            plans[qual] = EncodePlan(qual, 'skip')
+            continue
+        fits = info.width <= width and info.height <= height and (info.width == width or info.height == height)
+        copy_video = fits and info.vcodec == vcodecs[qual] and info.pix_fmt in COPY_PIX_FMTS
+        copy_audio = bool(info.audio) and all(a.get('codec_name') == acodecs[qual] and (a.get('channels') or 0) <= 2 for a in info.audio)
+        action = 'remux' if copy_video and copy_audio else 'encode'
+        plans[qual] = EncodePlan(qual, action, copy_video, copy_audio)
+    return plans
@@ -0,0 +1,55 @@
+from os import path as ospath, makedirs
+from asyncio import Semaphore
+from contextlib import asynccontextmanager
+from multiprocessing import cpu_count
+
+from aioshutil import rmtree as aiormtree
+from psutil import virtual_memory
+
+from bot import Var, LOGS
+
+def auto_slots():
+    cpu_slots = cpu_count() // Var.ENCODE_CORES_PER_SLOT
+    mem_slots = virtual_memory().available // (Var.ENCODE_MEM_PER_SLOT * 1024 ** 3)
+    return max(1, min(cpu_slots, mem_slots))
+
+class EncodePool:
+    """Hands out N encode slots in FIFO order, each with its own workspace under encode/"""
+    def __init__(self, slots=0, root="encode"):
+        self.slots = slots or auto_slots()
+        self.__root = root
+        self.__sem = Semaphore(self.slots)
+        self.queued = 0
+        self.running = 0
+        LOGS.info(f"Encode Pool Ready with {self.slots} Slot(s) !!")
+
+    def locked(self):
+        return self.__sem.locked()
+
+    @asynccontextmanager
+    async def slot(self, job_id):
+        self.queued += 1
+        try:
+            await self.__sem.acquire()
+        except BaseException:
+            self.queued -= 1
+            raise
+        self.queued -= 1
+
+        self.running += 1
+        workspace = ospath.join(self.__root, str(job_id))
+        makedirs(workspace, exist_ok=True)
+        try:
+            yield workspace
+        finally:
+            self.running -= 1
+            self.__sem.release()
+            try:
+                await aiormtree(workspace)
+            except Exception as e:
+                LOGS.error(f"Workspace Cleanup Failed: {e}")
+
+    def stats(self):
+        return {'slots': self.slots, 'running': self.running, 'queued': self.queued}
+
+encpool = EncodePool(Var.ENCODE_SLOTS)
@@ -0,0 +1,86 @@
+from time import time
+from functools import partial
+from multiprocessing import cpu_count
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from bot import Var, LOGS, bot_loop
+
+def _timed_call(pfunc):
+    started = time()
+    return started, pfunc()
+
+class NamedExecutor:
+    def __init__(self, name, workers, use_process=False):
+        self.name = name
+        self.workers = workers
+        self.use_process = use_process
+        self.__executor = None
+        self.inflight = 0
+        self.completed = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+
+    @property
+    def executor(self):
+        if self.__executor is None:
+            if self.use_process:
+                self.__executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self.__executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"{self.name}-pool")
+        return self.__executor
+
+    async def run(self, pfunc):
+        queued = time()
+        self.inflight += 1
+        try:
+            started, result = await bot_loop.run_in_executor(self.executor, partial(_timed_call, pfunc))
+        finally:
+            self.inflight -= 1
+        wait = max(started - queued, 0)
+        self.completed += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.total_run += time() - started
+        return result
+
+    def stats(self):
+        done = self.completed or 1
+        return {
+            'workers': self.workers,
+            'kind': "process" if self.use_process else "thread",
+            'inflight': self.inflight,
+            'queued': max(self.inflight - self.workers, 0),
+            'completed': self.completed,
+            'avg_wait': round(self.total_wait / done, 3),
+            'max_wait': round(self.max_wait, 3),
+            'avg_run': round(self.total_run / done, 3),
+        }
+
+    def shutdown(self):
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False, cancel_futures=True)
+            self.__executor = None
+
+class Executors:
+    def __init__(self):
+        self.__pools = {
+            'io': NamedExecutor('io', Var.IO_WORKERS or min(64, cpu_count() * 4)),
+            'cpu': NamedExecutor('cpu', Var.CPU_WORKERS or cpu_count(), Var.CPU_PROCESS_POOL),
+        }
+
+    def __getitem__(self, name):
+        return self.__pools[name]
+
+    async def run(self, pfunc, pool='io'):
+        return await self.__pools[pool].run(pfunc)
+
+    def stats(self):
+        return {name: pool.stats() for name, pool in self.__pools.items()}
+
+    def shutdown(self):
+        for pool in self.__pools.values():
+            pool.shutdown()
+        LOGS.info("Executor Pools Shutdown !!")
+
+executors = Executors()
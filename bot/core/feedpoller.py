@@ -0,0 +1,59 @@
+from asyncio import gather
+from traceback import format_exc
+
+from feedparser import parse as feedparse
+
+from bot import Var, LOGS
+from .func_utils import sync_to_async
+from .httpclient import http
+from .seenindex import seen
+
+class FeedPoller:
+    def __init__(self, timeout=30):
+        self.__timeout = timeout
+        self.__feeds = {}
+
+    @staticmethod
+    def entry_id(entry):
+        return entry.get('id') or entry.get('link') or entry.get('title')
+
+    async def poll(self):
+        results = await gather(*(self.__poll_feed(link) for link in list(Var.RSS_ITEMS)))
+        return [entry for entries in results for entry in entries]
+
+    async def __poll_feed(self, link):
+        state = self.__feeds.setdefault(link, {'etag': None, 'modified': None, 'seen': None})
+        headers = {}
+        if state['etag']:
+            headers['If-None-Match'] = state['etag']
+        if state['modified']:
+            headers['If-Modified-Since'] = state['modified']
+
+        try:
+            async with http.get(link, headers=headers, timeout=self.__timeout) as resp:
+                if resp.status == 304:
+                    return []
+                if resp.status != 200:
+                    LOGS.warning(f"RSS Feed Error: {resp.status} for {link}")
+                    return []
+                content = await resp.read()
+                resp_heads = {k.lower(): v for k, v in resp.headers.items()}
+        except Exception:
+            LOGS.error(format_exc())
+            return []
+
+        feed = await sync_to_async(feedparse, content, pool='cpu', response_headers=resp_heads)
+        state['etag'], state['modified'] = resp_heads.get('etag'), resp_heads.get('last-modified')
+
+        ids = [self.entry_id(entry) for entry in feed.entries]
+        if state['seen'] is None:
+            # First poll of this feed, whatever was released while the bot was down is picked up,
+            # a fresh install with an empty index only takes the latest release like before
+            new_entries = [entry for entry in feed.entries if entry.get('link') not in seen] if len(seen) else feed.entries[:1]
+        else:
+            new_entries = [entry for entry, eid in zip(feed.entries, ids) if eid not in state['seen']]
+        if ids:
+            state['seen'] = set(ids)
+
+        # Feeds list newest first, process them in release order
+        return new_entries[::-1]
@@ -1,16 +1,23 @@
-from re import findall 
 from math import floor
+from collections import deque
 from time import time
-from os import path as ospath
+from os import path as ospath, listdir, makedirs
+from multiprocessing import cpu_count
 from aiofiles import open as aiopen
-from aiofiles.os import remove as aioremove, rename as aiorename
+from aiofiles.os import rename as aiorename
+from aioshutil import rmtree as aiormtree
 from shlex import split as ssplit
-from asyncio import sleep as asleep, gather, create_subprocess_shell, create_task
+from asyncio import sleep as asleep, gather, create_subprocess_shell, create_subprocess_exec, create_task, Semaphore
 from asyncio.subprocess import PIPE
+from re import fullmatch
 
 from bot import Var, bot_loop, ffpids_cache, LOGS
-from .func_utils import mediainfo, convertBytes, convertTime, sendMessage, editMessage
+from .func_utils import convertBytes, convertTime, sendMessage
+from .statusedit import status
+from .mediaprobe import probe
 from .reporter import rep
+from .enccache import enccache
+from .artifacts import artifacts
 
 ffargs = {
     '1080': Var.FFCODE_1080,
@@ -19,49 +26,202 @@ ffargs = {
     'Hdri': Var.FFCODE_Hdri,
 }
 
+# Options taking no value, the first ones only steer the ffmpeg process and are dropped
+FLAG_OPTS = {'-y', '-n', '-hide_banner', '-nostdin', '-stats', '-nostats', '-an', '-vn', '-sn', '-dn', '-shortest'}
+AUDIO_OPTS = {'-ac', '-ar', '-ab', '-aq', '-vbr', '-acodec', '-af', '-an', '-sn'}
+
+def parse_ffcode(ffcode):
+    """Splits an FFCODE_* command into the scale and the video / audio / metadata output options the
+    multi output, chunked and planned encodes build on, None if the command cannot be split that way"""
+    try:
+        tokens = ssplit(ffcode)
+    except ValueError:
+        return None
+    if not tokens or ospath.basename(tokens[0]) != "ffmpeg":
+        return None
+    prof, inputs, args, i = {'scale': None, 'video': [], 'audio': [], 'meta': []}, 0, tokens[1:], 0
+    while i < len(args):
+        opt = args[i]
+        if not opt.startswith("-"):
+            # Output placeholder
+            i += 1
+            continue
+        value = [] if opt in FLAG_OPTS else args[i + 1:i + 2]
+        i += 1 + len(value)
+        base, _, spec = opt.partition(":")
+        if opt in ('-y', '-n', '-hide_banner', '-nostdin', '-stats', '-nostats', '-progress', '-map'):
+            # Each mode maps the streams itself
+            continue
+        if opt == '-i':
+            if (inputs := inputs + 1) > 1:
+                return None
+        elif base in ('-vf', '-filter_complex', '-lavfi') or (base == '-filter' and not spec.startswith('a')) or (base in ('-c', '-codec') and not spec):
+            return None
+        elif opt == '-s':
+            if not value or not fullmatch(r"\d+x\d+", value[0]):
+                return None
+            prof['scale'] = value[0].replace("x", ":")
+        elif base in ('-metadata', '-disposition'):
+            prof['meta'] += [opt, *value]
+        elif spec.startswith(('a', 's')) or base in AUDIO_OPTS:
+            prof['audio'] += [opt, *value]
+        else:
+            prof['video'] += [opt, *value]
+    return prof if prof['scale'] else None
+
+# Per tier output options of the decode-once multi output, chunked and planned modes, taken from FFCODE_*
+ffprofiles = {qual: prof for qual, ffcode in ffargs.items() if qual != 'Hdri' and (prof := parse_ffcode(ffcode))}
+if Var.MULTI_ENCODE or Var.CHUNK_ENCODE or Var.SMART_ENCODE:
+    for qual in ffargs.keys() - ffprofiles.keys() - {'Hdri'}:
+        LOGS.warning(f"FFCODE_{qual} Uses Filters, Extra Inputs or No -s Size, {qual}p Always Runs its Own FFCODE_{qual} Encode")
+
+def profile_vargs(qual):
+    return list(ffprofiles[qual]['video'])
+
+def profile_aargs(qual):
+    return list(ffprofiles[qual]['audio'])
+
+def profile_args(qual):
+    prof = ffprofiles[qual]
+    return [*prof['video'], *prof['audio'], *prof['meta']]
+
+def profile_code(qual):
+    """Path independent description of a profile encode, used for output cache keys"""
+    return " ".join(["scale=" + ffprofiles[qual]['scale'], *profile_args(qual)])
+
+def multi_ffargs(in_path, prog_file, outputs):
+    """Single ffmpeg command decoding the source once and splitting it into every (qual, out_path) output"""
+    splits = "".join(f"[s{i}]" for i in range(len(outputs)))
+    fgraph = f"[0:v:0]split={len(outputs)}{splits}"
+    for i, (qual, _) in enumerate(outputs):
+        fgraph += f";[s{i}]scale={ffprofiles[qual]['scale']}[v{i}]"
+    cmd = ["ffmpeg", "-hide_banner", "-i", in_path, "-progress", prog_file, "-filter_complex", fgraph]
+    for i, (qual, out_path) in enumerate(outputs):
+        cmd += ["-map", f"[v{i}]", "-map", "0:a?", "-map", "0:s?", "-map", "0:t?", *profile_args(qual), out_path]
+    return cmd + ["-y"]
+
+encode_jobs = {}
+
+class EncodeProgress:
+    """Live state of one ffmpeg run, parsed from its -progress key=value blocks"""
+    def __init__(self, name, qual, duration=0):
+        self.name = name
+        self.qual = qual
+        self.duration = duration
+        self.out_time = 0.0
+        self.fps = 0.0
+        self.speed = 0.0
+        self.bitrate = "N/A"
+        self.size = 0
+        self.status = "starting"
+        self.started = time()
+        self.__block = {}
+
+    def feed(self, line):
+        """Returns True once a full progress block has been parsed"""
+        key, _, value = line.strip().partition("=")
+        if key != "progress":
+            self.__block[key] = value.strip()
+            return False
+        block, self.__block = self.__block, {}
+        if (out_us := block.get('out_time_us') or block.get('out_time_ms', '')).isdigit():
+            self.out_time = int(out_us) / 1000000
+        if block.get('total_size', '').isdigit():
+            self.size = int(block['total_size'])
+        try:
+            self.fps = float(block.get('fps', self.fps))
+            self.speed = float(block.get('speed', '').rstrip('x') or self.speed)
+        except ValueError:
+            pass
+        self.bitrate = block.get('bitrate', self.bitrate)
+        self.status = value.strip()
+        return True
+
+    @property
+    def ended(self):
+        return self.status == "end"
+
+    @property
+    def percent(self):
+        return min(self.out_time / self.duration * 100, 100) if self.duration else 0
+
+    @property
+    def eta(self):
+        return (self.duration - self.out_time) / self.speed if self.speed > 0 else 0
+
+    def stats(self):
+        return {'name': self.name, 'qual': self.qual, 'percent': round(self.percent, 2), 'fps': self.fps,
+                'speed': self.speed, 'bitrate': self.bitrate, 'size': self.size, 'eta': round(self.eta)}
+
 class FFEncoder:
-    def __init__(self, message, path, name, qual):
+    def __init__(self, message, path, name, qual, stream=None, workspace="encode", info_hash=None):
         self.__proc = None
+        self.__procs = []
+        self.__stream = stream
         self.is_cancelled = False
         self.message = message
         self.__name = name
         self.__qual = qual
         self.dl_path = path
         self.__total_time = None
-        self.out_path = ospath.join("encode", name)
-        self.__prog_file = 'prog.txt'
+        self.__outputs = []
+        self.__src_path = path
+        self.__workspace = workspace
+        self.out_path = ospath.join(workspace, name)
+        self.__prog_file = "pipe:1"
+        self.__stderr = deque(maxlen=50)
+        self.__info_hash = info_hash
+        self.__source_key = None
+        self.state = None
         self.__start_time = time()
 
-    async def start_encode(self):
-        # Skip encoding if quality is HDRip
-        if self.__qual == 'Hdri':
-            # Simply copy the file without encoding
-            out_npath = ospath.join("encode", self.__name)
-            await aioremove(self.dl_path)  # Remove any existing file in the output path if necessary
-            await aiorename(self.dl_path, out_npath)  # Rename the downloaded file to the output path
-            return out_npath
-
-        # Continue with encoding process for other qualities
-        if ospath.exists(self.__prog_file):
-            await aioremove(self.__prog_file)
-
-        async with aiopen(self.__prog_file, 'w+'):
-            LOGS.info("Progress Temp Generated !")
-            pass
-
-        dl_npath, out_npath = ospath.join("encode", "ffanimeadvin.mkv"), ospath.join("encode", "ffanimeadvout.mkv")
-        await aiorename(self.dl_path, dl_npath)
-
-        ffcode = ffargs[self.__qual].format(dl_npath, self.__prog_file, out_npath)
+    async def __prepare(self):
+        if self.__stream:
+            # Source is still downloading, feed it to ffmpeg through stdin as pieces arrive
+            return "pipe:0"
+        # Hardlinked under a shell safe name, every tier of the job reads the same inode
+        self.__src_path = await artifacts.get(self.dl_path).link(ospath.join(self.__workspace, "ffanimeadvin.mkv"))
+        return self.__src_path
 
+    async def __run(self, ffcode):
         LOGS.info(f'FFCode: {ffcode}')
-        self.__proc = await create_subprocess_shell(ffcode, stdout=PIPE, stderr=PIPE)
+        stdin = PIPE if self.__stream else None
+        if isinstance(ffcode, list):
+            self.__proc = await create_subprocess_exec(*ffcode, stdin=stdin, stdout=PIPE, stderr=PIPE)
+        else:
+            self.__proc = await create_subprocess_shell(ffcode, stdin=stdin, stdout=PIPE, stderr=PIPE)
         proc_pid = self.__proc.pid
         ffpids_cache.append(proc_pid)
-        _, return_code = await gather(create_task(self.progress()), self.__proc.wait())
-        ffpids_cache.remove(proc_pid)
+        try:
+            _, _, return_code, *_ = await gather(create_task(self.progress()), self.__drain_stderr(), self.__proc.wait(), *([self.__feed_stream()] if self.__stream else []))
+        except BaseException:
+            # A cancelled pipeline stage must not leave ffmpeg running
+            await self.cancel_encode()
+            raise
+        finally:
+            ffpids_cache.remove(proc_pid)
+
+        if not self.is_cancelled and return_code != 0:
+            await rep.report("".join(self.__stderr).strip(), "error")
+        return return_code
 
-        await aiorename(dl_npath, self.dl_path)
+    async def start_encode(self, plan=None):
+        # HDRip is the source itself, passed through without encoding
+        if self.__qual == 'Hdri':
+            return await artifacts.get(self.dl_path).link(self.out_path)
+
+        # Continue with encoding process for other qualities
+        ckey = await self.__cache_key(plan.code if plan else ffargs[self.__qual])
+        if ckey and await enccache.fetch(ckey, self.out_path):
+            return self.out_path
+
+        dl_npath, out_npath = await self.__prepare(), ospath.join(self.__workspace, "ffanimeadvout.mkv")
+        if plan:
+            # Planned tiers stream copy whatever already matches the target and only re-encode the rest
+            ffcode = plan.ffargs(dl_npath, self.__prog_file, out_npath)
+        else:
+            ffcode = ffargs[self.__qual].format(dl_npath, self.__prog_file, out_npath)
+        return_code = await self.__run(ffcode)
 
         if self.is_cancelled:
             return
@@ -69,14 +229,186 @@ class FFEncoder:
         if return_code == 0:
             if ospath.exists(out_npath):
                 await aiorename(out_npath, self.out_path)
+                if ckey:
+                    await enccache.store(ckey, self.out_path)
             return self.out_path
-        else:
-            await rep.report((await self.__proc.stderr.read()).decode().strip(), "error")
-            
+
+    async def start_multi_encode(self, names):
+        """Encodes every {qual: filename} in one ffmpeg run, returns {qual: out_path}"""
+        out_paths, ckeys = {}, {}
+        for qual, filename in names.items():
+            ckeys[qual] = await self.__cache_key(profile_code(qual))
+            if ckeys[qual] and await enccache.fetch(ckeys[qual], out_path := ospath.join(self.__workspace, filename)):
+                out_paths[qual] = out_path
+
+        self.__outputs = [(qual, ospath.join(self.__workspace, f"ffanimeadvout{qual}.mkv")) for qual in names if qual not in out_paths]
+        if not self.__outputs:
+            return out_paths
+        dl_npath = await self.__prepare()
+        return_code = await self.__run(multi_ffargs(dl_npath, self.__prog_file, self.__outputs))
+
+        if self.is_cancelled or return_code != 0:
+            return out_paths
+
+        for qual, out_npath in self.__outputs:
+            if ospath.exists(out_npath):
+                out_paths[qual] = ospath.join(self.__workspace, names[qual])
+                await aiorename(out_npath, out_paths[qual])
+                if ckeys[qual]:
+                    await enccache.store(ckeys[qual], out_paths[qual])
+        return out_paths
+
+    async def __cache_key(self, ffcode):
+        if not enccache.enabled or (self.__stream and not self.__info_hash):
+            return None
+        if self.__source_key is None:
+            self.__source_key = await enccache.source_key(self.dl_path, self.__info_hash)
+        return enccache.key(self.__source_key, ffcode)
+
+    async def __exec(self, cmd):
+        proc = await create_subprocess_exec(*cmd, stdout=PIPE, stderr=PIPE)
+        self.__procs.append(proc)
+        ffpids_cache.append(proc.pid)
+        try:
+            stdout, stderr = await proc.communicate()
+        except BaseException:
+            proc.kill()
+            raise
+        finally:
+            ffpids_cache.remove(proc.pid)
+            self.__procs.remove(proc)
+        if proc.returncode != 0 and not self.is_cancelled:
+            await rep.report(stderr.decode().strip()[-3000:], "error")
+        return proc.returncode, stdout.decode()
+
+    async def start_chunked_encode(self):
+        """Splits the source on keyframes, encodes the GOP aligned segments in parallel and stitches them back"""
+        prof = ffprofiles[self.__qual]
+        ckey = await self.__cache_key(profile_code(self.__qual))
+        if ckey and await enccache.fetch(ckey, self.out_path):
+            return self.out_path
+        chunk_dir = ospath.join(self.__workspace, f"chunks{self.__qual}")
+        makedirs(chunk_dir, exist_ok=True)
+        src = self.dl_path
+
+        if not (info := await probe(src)):
+            return
+        cuts, last = [], 0.0
+        for kf in await info.keyframes():
+            if kf - last >= Var.CHUNK_SECONDS:
+                cuts.append(kf)
+                last = kf
+        if self.is_cancelled:
+            return
+
+        seg_fmt = ospath.join(chunk_dir, "src%04d.mkv")
+        split_cmd = ["ffmpeg", "-hide_banner", "-i", src, "-map", "0:v:0", "-c", "copy", "-f", "segment", "-reset_timestamps", "1"]
+        if cuts:
+            split_cmd += ["-segment_times", ",".join(f"{c:.3f}" for c in cuts)]
+        audio_path = ospath.join(chunk_dir, "audio.mka")
+        audio_cmd = ["ffmpeg", "-hide_banner", "-i", src, "-vn", "-map", "0:a?", "-map", "0:s?", "-map", "0:t?", *profile_aargs(self.__qual), audio_path, "-y"]
+        # Audio and subtitles are handled in one pass next to the video chunks
+        audio_task = create_task(self.__exec(audio_cmd))
+        split_code, _ = await self.__exec(split_cmd + [seg_fmt, "-y"])
+        segments = sorted(f for f in listdir(chunk_dir) if f.startswith("src"))
+        if split_code != 0 or not segments:
+            audio_task.cancel()
+            return
+
+        done, nworkers = [0], Var.CHUNK_WORKERS or max(1, cpu_count() // 2)
+        workers = Semaphore(nworkers)
+        async def encode_segment(seg):
+            async with workers:
+                if self.is_cancelled:
+                    return 1
+                code, _ = await self.__exec(["ffmpeg", "-hide_banner", "-i", ospath.join(chunk_dir, seg), "-vf", f"scale={prof['scale']}",
+                                             *profile_vargs(self.__qual), ospath.join(chunk_dir, f"enc{seg[3:]}"), "-y"])
+            done[0] += 1
+            await status.update(self.message, f"""‣ <b>Anime Name :</b> <b><i>{self.__name}</i></b>
+
+‣ <b>Status :</b> <i>Encoding Chunks</i>
+    ‣ <b>Chunks :</b> {done[0]} / {len(segments)}
+    ‣ <b>Workers :</b> {nworkers}
+    ‣ <b>Time Took :</b> {convertTime(time() - self.__start_time)}""")
+            return code
+
+        codes = await gather(*(encode_segment(seg) for seg in segments))
+        audio_code, _ = await audio_task
+        if self.is_cancelled or any(codes) or audio_code != 0:
+            return
+
+        concat_list = ospath.join(chunk_dir, "concat.txt")
+        async with aiopen(concat_list, "w") as f:
+            await f.write("".join(f"file 'enc{seg[3:]}'\n" for seg in segments))
+        code, _ = await self.__exec(["ffmpeg", "-hide_banner", "-f", "concat", "-safe", "0", "-i", concat_list, "-i", audio_path,
+                                     "-map", "0:v", "-map", "1", "-c", "copy", *prof['meta'], self.out_path, "-y"])
+        await aiormtree(chunk_dir)
+        if code != 0 or not ospath.exists(self.out_path):
+            return
+        if ckey:
+            await enccache.store(ckey, self.out_path)
+        return self.out_path
+
+    async def progress(self):
+        # A streamed source is still downloading, probing the partial file would give a wrong duration
+        info = await probe(self.__src_path) if not self.__stream else None
+        self.__total_time = info.duration if info and info.duration else 1440
+        self.state = EncodeProgress(self.__name, self.__qual, self.__total_time)
+        encode_jobs[id(self)] = self.state
+        try:
+            async for line in self.__proc.stdout:
+                if not self.state.feed(line.decode(errors="ignore")):
+                    continue
+                if self.state.ended:
+                    break
+                if not self.is_cancelled:
+                    await status.update(self.message, self.__progress_text())
+        finally:
+            encode_jobs.pop(id(self), None)
+
+    def __progress_text(self):
+        st = self.state
+        percent = round(st.percent, 2)
+        tsize = st.size / (max(percent, 0.01) / 100)
+        bar = floor(percent / 8) * "█" + (12 - floor(percent / 8)) * "▒"
+        progress_str = f"""‣ <b>Anime Name :</b> <b><i>{self.__name}</i></b>
+
+‣ <b>Status :</b> <i>Encoding</i>
+    <code>[{bar}]</code> {percent}%
+    
+    ‣ <b>Size :</b> {convertBytes(st.size)} out of ~ {convertBytes(tsize)}
+    ‣ <b>Speed :</b> {st.speed}x ({st.fps} fps, {st.bitrate})
+    ‣ <b>Time Took :</b> {convertTime(time() - st.started)}
+    ‣ <b>Time Left :</b> {convertTime(st.eta)}"""
+        for qual, out_npath in self.__outputs:
+            osize = ospath.getsize(out_npath) if ospath.exists(out_npath) else 0
+            progress_str += f"\n    ‣ <b>{qual}p :</b> {convertBytes(osize)}"
+        return progress_str
+
+    async def __drain_stderr(self):
+        async for line in self.__proc.stderr:
+            self.__stderr.append(line.decode(errors="ignore"))
+
+    async def __feed_stream(self):
+        try:
+            while (chunk := await self.__stream.read()):
+                self.__proc.stdin.write(chunk)
+                await self.__proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            # Fails the tier, __run kills ffmpeg on the way out
+            LOGS.error(f"Stream Feed Failed: {e}")
+            raise
+        finally:
+            await self.__stream.close()
+            self.__proc.stdin.close()
+
     async def cancel_encode(self):
         self.is_cancelled = True
-        if self.__proc is not None:
-            try:
-                self.__proc.kill()
-            except:
-                pass
+        for proc in [self.__proc, *self.__procs]:
+            if proc is not None:
+                try:
+                    proc.kill()
+                except:
+                    pass
@@ -1,18 +1,14 @@
-from multiprocessing import cpu_count
-from concurrent.futures import ThreadPoolExecutor
 from functools import partial, wraps
-from json import loads as jloads
 from re import findall
 from math import floor
-from os import path as ospath
-from time import time, sleep
+from os import path as ospath, sep as ossep, listdir
+from time import time
 from traceback import format_exc
-from asyncio import sleep as asleep, create_subprocess_shell
-from asyncio.subprocess import PIPE
+from asyncio import sleep as asleep
 from base64 import urlsafe_b64encode, urlsafe_b64decode
 
-from aiohttp import ClientSession
 from aiofiles import open as aiopen
+from aiofiles.os import remove as aioremove
 from aioshutil import rmtree as aiormtree
 from html_telegraph_poster import TelegraphPoster
 from feedparser import parse as feedparse
@@ -22,6 +18,9 @@ from pyrogram.errors import MessageNotModified, FloodWait, UserNotParticipant, R
 
 from bot import bot, bot_loop, LOGS, Var
 from .reporter import rep
+from .executors import executors
+from .httpclient import http
+from .tgdispatch import tgd, HIGH
 
 def handle_logs(func):
     @wraps(func)
@@ -32,10 +31,10 @@ def handle_logs(func):
             await rep.report(format_exc(), "error")
     return wrapper
     
-async def sync_to_async(func, *args, wait=True, **kwargs):
+async def sync_to_async(func, *args, wait=True, pool='io', **kwargs):
     pfunc = partial(func, *args, **kwargs)
-    future = bot_loop.run_in_executor(ThreadPoolExecutor(max_workers=cpu_count() * 125), pfunc)
-    return await future if wait else future
+    future = executors.run(pfunc, pool)
+    return await future if wait else bot_loop.create_task(future)
     
 def new_task(func):
     @wraps(func)
@@ -45,7 +44,14 @@ def new_task(func):
 
 async def getfeed(link, index=0):
     try:
-        feed = await sync_to_async(feedparse, link)
+        # Fetched over the pooled client like FeedPoller, feedparser only parses the bytes
+        async with http.get(link) as resp:
+            if resp.status != 200:
+                LOGS.warning(f"RSS Feed Error: {resp.status} for {link}")
+                return None
+            content = await resp.read()
+            resp_heads = {k.lower(): v for k, v in resp.headers.items()}
+        feed = await sync_to_async(feedparse, content, pool='cpu', response_headers=resp_heads)
         return feed.entries[index]
     except IndexError:
         return None
@@ -55,9 +61,8 @@ async def getfeed(link, index=0):
 
 @handle_logs
 async def aio_urldownload(link):
-    async with ClientSession() as sess:
-        async with sess.get(link) as data:
-            image = await data.read()
+    async with http.get(link) as data:
+        image = await data.read()
     path = f"thumbs/{link.split('/')[-1]}"
     if not path.endswith((".jpg" or ".png")):
         path += ".jpg"
@@ -65,8 +70,7 @@ async def aio_urldownload(link):
         await f.write(image)
     return path
 
-@handle_logs
-async def get_telegraph(out):
+def post_telegraph(out):
     client = TelegraphPoster(use_api=True)
     client.create_api_token("Mediainfo")
     uname = Var.BRAND_UNAME.lstrip('@')
@@ -80,19 +84,24 @@ async def get_telegraph(out):
 """,
         )
     return page.get("url")
+
+@handle_logs
+async def get_telegraph(out):
+    return await sync_to_async(post_telegraph, out)
     
 async def sendMessage(chat, text, buttons=None, get_error=False, **kwargs):
     try:
         if isinstance(chat, int):
-            return await bot.send_message(chat_id=chat, text=text, disable_web_page_preview=True,
+            return await tgd.call(chat, bot.send_message, chat_id=chat, text=text, disable_web_page_preview=True,
                                         disable_notification=False, reply_markup=buttons, **kwargs)
         else:
-            return await chat.reply(text=text, quote=True, disable_web_page_preview=True, disable_notification=False,
+            return await tgd.call(chat.chat.id, chat.reply, text=text, quote=True, disable_web_page_preview=True, disable_notification=False,
                                     reply_markup=buttons, **kwargs)
     except FloodWait as f:
-        await rep.report(f, "warning")
-        sleep(f.value * 1.2)
-        return await sendMessage(chat, text, buttons, get_error, **kwargs)
+        await rep.report(f"Send Dropped after Retries: {f}", "warning")
+        if get_error:
+            raise f
+        return str(f)
     except ReplyMarkupInvalid:
         return await sendMessage(chat, text, None, get_error, **kwargs)
     except Exception as e:
@@ -101,18 +110,19 @@ async def sendMessage(chat, text, buttons=None, get_error=False, **kwargs):
             raise e
         return str(e)
         
-async def editMessage(msg, text, buttons=None, get_error=False, **kwargs):
+async def editMessage(msg, text, buttons=None, get_error=False, priority=HIGH, **kwargs):
     try:
         if not msg:
             return None
-        return await msg.edit_text(text=text, disable_web_page_preview=True, 
-                                        reply_markup=buttons, **kwargs)
+        return await tgd.call(msg.chat.id, msg.edit_text, text=text, disable_web_page_preview=True, 
+                                        reply_markup=buttons, priority=priority, **kwargs)
     except FloodWait as f:
-        await rep.report(f, "warning")
-        sleep(f.value * 1.2)
-        return await editMessage(msg, text, buttons, get_error, **kwargs)
+        await rep.report(f"Edit Dropped after Retries: {f}", "warning")
+        if get_error:
+            raise f
+        return str(f)
     except ReplyMarkupInvalid:
-        return await editMessage(msg, text, None, get_error, **kwargs)
+        return await editMessage(msg, text, None, get_error, priority, **kwargs)
     except (MessageNotModified, MessageIdInvalid):
         pass
     except Exception as e:
@@ -160,28 +170,32 @@ async def get_fsubs(uid, txtargs):
         btns.append([InlineKeyboardButton('🗂 Get Files', url=f'https://t.me/{(await bot.get_me()).username}?start={txtargs[1]}')])
     return txt, btns
 
-async def mediainfo(file, get_json=False, get_duration=False):
-    try:
-        outformat = "HTML"
-        if get_duration or get_json:
-            outformat = "JSON"
-        process = await create_subprocess_shell(f"mediainfo '''{file}''' --Output={outformat}", stdout=PIPE, stderr=PIPE)
-        stdout, _ = await process.communicate()
-        if get_duration:
-            try:
-                return float(jloads(stdout.decode())['media']['track'][0]['Duration'])
-            except Exception:
-                return 1440 # 24min
-        return await get_telegraph(stdout.decode())
-    except Exception as err:
-        await rep.report(format_exc(), "error")
-        return ""
-        
 async def clean_up():
-    try:
-        (await aiormtree(dirtree) for dirtree in ("downloads", "thumbs", "encode"))
-    except Exception as e:
-        LOGS.error(str(e))
+    # Partial downloads are kept, they are resumed from torrents/resume on next start
+    for dirtree in ("thumbs", "encode", "addons"):
+        try:
+            if ospath.isdir(dirtree):
+                await aiormtree(dirtree)
+        except Exception as e:
+            LOGS.error(str(e))
+
+async def clean_downloads(keep, root="downloads"):
+    """Removes whatever failed or abandoned downloads left in root, keep holds the paths still in use"""
+    if not ospath.isdir(root):
+        return
+    keep = {ospath.relpath(path, root).split(ossep)[0] for path in keep if path}
+    for entry in listdir(root):
+        if entry in keep:
+            continue
+        path = ospath.join(root, entry)
+        try:
+            if ospath.isdir(path):
+                await aiormtree(path)
+            else:
+                await aioremove(path)
+            LOGS.info(f"Removed Stale Download: {entry}")
+        except Exception as e:
+            LOGS.error(str(e))
 
 def convertTime(s: int) -> str:
     m, s = divmod(int(s), 60)
@@ -0,0 +1,65 @@
+from asyncio import sleep as asleep, TimeoutError as AsyncTimeoutError
+from contextlib import asynccontextmanager
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, ClientError
+
+from bot import Var, LOGS
+
+RETRY_STATUSES = {500, 502, 503, 504}
+
+class HTTPClient:
+    def __init__(self):
+        self.__session = None
+
+    @property
+    def session(self):
+        if self.__session is None or self.__session.closed:
+            connector = TCPConnector(
+                limit=Var.HTTP_POOL_SIZE,
+                limit_per_host=Var.HTTP_PER_HOST,
+                ttl_dns_cache=300,
+                keepalive_timeout=60,
+            )
+            self.__session = ClientSession(connector=connector, timeout=ClientTimeout(total=Var.HTTP_TIMEOUT, connect=15))
+        return self.__session
+
+    async def start(self):
+        _ = self.session
+        LOGS.info("HTTP Client Pool Started !!")
+
+    async def close(self):
+        if self.__session is not None and not self.__session.closed:
+            await self.__session.close()
+        self.__session = None
+
+    @asynccontextmanager
+    async def request(self, method, url, retries=None, timeout=None, **kwargs):
+        """Yields the response, retrying connection errors and 5xx answers with exponential backoff"""
+        retries = Var.HTTP_RETRIES if retries is None else retries
+        if timeout is not None:
+            kwargs['timeout'] = ClientTimeout(total=timeout)
+        for attempt in range(retries + 1):
+            try:
+                resp = await self.session.request(method, url, **kwargs)
+            except (ClientError, AsyncTimeoutError) as err:
+                if attempt >= retries:
+                    raise
+                LOGS.warning(f"HTTP {method} {url} Failed: {err!r}, Retrying...")
+            else:
+                if resp.status not in RETRY_STATUSES or attempt >= retries:
+                    break
+                resp.release()
+                LOGS.warning(f"HTTP {method} {url} Returned {resp.status}, Retrying...")
+            await asleep(min(2 ** attempt, 30))
+        try:
+            yield resp
+        finally:
+            resp.release()
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+http = HTTPClient()
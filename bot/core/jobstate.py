@@ -0,0 +1,108 @@
+from time import time
+from os import path as ospath
+
+live_jobs = {}
+
+class TierState:
+    """One quality tier of a job: pending -> encoding -> encoded -> uploading -> uploaded, or skipped / failed"""
+    __slots__ = ('qual', 'stage', 'filename', 'out_path', 'size', 'done', 'total', 'msg_id', 'since', 'timings')
+
+    DONE = ('uploaded', 'skipped')
+
+    def __init__(self, qual):
+        self.qual = qual
+        self.stage = 'pending'
+        self.filename = None
+        self.out_path = None
+        self.size = 0
+        self.done = 0
+        self.total = 0
+        self.msg_id = None
+        self.since = time()
+        self.timings = {}
+
+    def enter(self, stage):
+        now = time()
+        self.timings[self.stage] = self.timings.get(self.stage, 0.0) + now - self.since
+        self.stage, self.since = stage, now
+
+    def progress(self, done, total):
+        self.done, self.total = done, total
+
+    @property
+    def finished(self):
+        return self.stage in self.DONE
+
+    def record(self):
+        return {'stage': self.stage, 'filename': self.filename, 'out_path': self.out_path, 'size': self.size, 'msg_id': self.msg_id}
+
+    @classmethod
+    def restore(cls, qual, rec):
+        tier = cls(qual)
+        tier.filename, tier.out_path, tier.size, tier.msg_id = rec.get('filename'), rec.get('out_path'), rec.get('size', 0), rec.get('msg_id')
+        if rec.get('stage') in cls.DONE:
+            tier.stage = rec['stage']
+        elif tier.out_path and ospath.exists(tier.out_path):
+            # Encoded before the restart, only the upload is left
+            tier.stage = 'encoded'
+        return tier
+
+    def stats(self):
+        return {'qual': self.qual, 'stage': self.stage, 'size': self.size, 'done': self.done, 'total': self.total,
+                'timings': {stage: round(sec, 2) for stage, sec in self.timings.items()}}
+
+class JobState:
+    """Everything one episode run tracks, owned by that run only so concurrent episodes never share counters"""
+    __slots__ = ('job_id', 'name', 'link', 'ani_id', 'ep_no', 'post_id', 'stat_id', 'dl', 'stage', 'tiers', 'blocked', 'started')
+
+    def __init__(self, job_id, name, quals, ani_id=None, ep_no=None, link=None):
+        self.job_id = job_id
+        self.name = name
+        self.link = link
+        self.ani_id = ani_id
+        self.ep_no = ep_no
+        self.post_id = None
+        self.stat_id = None
+        self.dl = None
+        self.stage = 'new'
+        self.tiers = {qual: TierState(qual) for qual in quals}
+        # Time each pipeline stage spent waiting on the other one
+        self.blocked = {'encode': 0.0, 'upload': 0.0}
+        self.started = time()
+
+    def record(self):
+        """Durable part of the job: new -> posted -> downloaded, plus every tier's own stage"""
+        return {'name': self.name, 'link': self.link, 'ani_id': self.ani_id, 'ep_no': self.ep_no, 'post_id': self.post_id,
+                'stat_id': self.stat_id, 'dl': self.dl, 'stage': self.stage, 'tiers': {qual: tier.record() for qual, tier in self.tiers.items()}}
+
+    @classmethod
+    def restore(cls, job_id, rec):
+        job = cls(job_id, rec['name'], [], rec.get('ani_id'), rec.get('ep_no'), rec.get('link'))
+        job.post_id, job.stat_id, job.dl, job.stage = rec.get('post_id'), rec.get('stat_id'), rec.get('dl'), rec.get('stage', 'new')
+        job.tiers = {qual: TierState.restore(qual, trec) for qual, trec in rec.get('tiers', {}).items()}
+        return job
+
+    def __getitem__(self, qual):
+        return self.tiers[qual]
+
+    def register(self):
+        live_jobs[self.job_id] = self
+        return self
+
+    def unregister(self):
+        live_jobs.pop(self.job_id, None)
+
+    @property
+    def completed(self):
+        return sum(tier.finished for tier in self.tiers.values())
+
+    @property
+    def total(self):
+        return len(self.tiers)
+
+    def spent(self, stage):
+        return sum(tier.timings.get(stage, 0.0) for tier in self.tiers.values())
+
+    def stats(self):
+        return {'name': self.name, 'completed': self.completed, 'total': self.total, 'elapsed': round(time() - self.started),
+                'tiers': [tier.stats() for tier in self.tiers.values()]}
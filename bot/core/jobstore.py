@@ -0,0 +1,70 @@
+from time import time
+from json import loads as jloads, dumps as jdumps
+from os import path as ospath, makedirs, replace as osreplace
+
+from aiofiles import open as aiopen
+from aioshutil import rmtree as aiormtree
+
+from bot import LOGS
+from .database import db
+
+class JobStore:
+    """Durable table of in-flight episode runs, one record per job checkpointed on every stage transition.
+    Mongo is the primary store, a local JSON file takes the records whenever Mongo is unreachable"""
+    def __init__(self, root="jobs"):
+        self.root = root
+        self.__path = ospath.join(root, "jobs.json")
+        self.__local = {}
+        makedirs(root, exist_ok=True)
+        if ospath.exists(self.__path):
+            try:
+                with open(self.__path) as f:
+                    self.__local = jloads(f.read())
+            except Exception as e:
+                LOGS.error(f"Local Job Store Load Failed: {e}")
+
+    def workdir(self, job):
+        """Outputs kept here survive workspace cleanup and restarts until the job is done"""
+        path = ospath.join(self.root, str(job.post_id))
+        makedirs(path, exist_ok=True)
+        return path
+
+    async def __save_local(self):
+        tmp_path = f"{self.__path}.tmp"
+        async with aiopen(tmp_path, "w") as f:
+            await f.write(jdumps(self.__local))
+        osreplace(tmp_path, self.__path)
+
+    async def checkpoint(self, job):
+        record = job.record()
+        record['updated'] = time()
+        try:
+            await db.saveJob(job.job_id, record)
+            if self.__local.pop(job.job_id, None) is not None:
+                await self.__save_local()
+        except Exception as e:
+            LOGS.error(f"Job Checkpoint to Mongo Failed, Using Local Store: {e}")
+            self.__local[job.job_id] = record
+            await self.__save_local()
+
+    async def remove(self, job):
+        try:
+            await db.delJob(job.job_id)
+        except Exception as e:
+            LOGS.error(f"Job Removal from Mongo Failed: {e}")
+        if self.__local.pop(job.job_id, None) is not None:
+            await self.__save_local()
+        if job.post_id and ospath.isdir(path := ospath.join(self.root, str(job.post_id))):
+            await aiormtree(path, ignore_errors=True)
+
+    async def pending(self):
+        """Every unfinished job, local records win since they are only written when Mongo missed an update"""
+        jobs = {}
+        try:
+            jobs = {job.pop('_id'): job for job in await db.getJobs()}
+        except Exception as e:
+            LOGS.error(f"Loading Jobs from Mongo Failed: {e}")
+        jobs.update(self.__local)
+        return jobs
+
+jobstore = JobStore()
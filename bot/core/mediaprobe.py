@@ -0,0 +1,99 @@
+from os import path as ospath, stat
+from json import loads as jloads
+from asyncio import Lock, create_subprocess_exec
+from asyncio.subprocess import PIPE
+from collections import OrderedDict
+
+from bot import LOGS
+from .func_utils import sync_to_async
+
+class MediaInfo:
+    """Everything the pipeline needs to know about one media file, from a single ffprobe run"""
+    __slots__ = ('path', 'size', 'duration', 'bitrate', 'container', 'streams', 'video', 'audio', 'subtitles',
+                 'width', 'height', 'vcodec', 'pix_fmt', 'fps', '_keyframes', '_kf_lock')
+
+    def __init__(self, path, data):
+        fmt = data.get('format', {})
+        self.path = path
+        self.size = int(fmt.get('size') or 0)
+        self.duration = float(fmt.get('duration') or 0)
+        self.bitrate = int(fmt.get('bit_rate') or 0)
+        self.container = fmt.get('format_name', "")
+        self.streams = data.get('streams', [])
+        self.video = next((s for s in self.streams if s.get('codec_type') == 'video' and not s.get('disposition', {}).get('attached_pic')), {})
+        self.audio = [s for s in self.streams if s.get('codec_type') == 'audio']
+        self.subtitles = [s for s in self.streams if s.get('codec_type') == 'subtitle']
+        self.width = int(self.video.get('width') or 0)
+        self.height = int(self.video.get('height') or 0)
+        self.vcodec = self.video.get('codec_name', "")
+        self.pix_fmt = self.video.get('pix_fmt', "")
+        num, _, den = (self.video.get('avg_frame_rate') or "0/1").partition("/")
+        self.fps = round(float(num) / float(den), 3) if float(den or 0) else 0.0
+        self._keyframes = None
+        self._kf_lock = Lock()
+
+    async def keyframes(self):
+        """Video keyframe timestamps, read from packet flags so nothing is decoded"""
+        async with self._kf_lock:
+            if self._keyframes is None:
+                if (out := await run_probe("-select_streams", "v:0", "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", self.path)) is None:
+                    return []
+                keyframes = []
+                for line in out.splitlines():
+                    pts, _, flags = line.partition(",")
+                    if "K" in flags and pts not in ("", "N/A"):
+                        keyframes.append(float(pts))
+                self._keyframes = sorted(keyframes)
+        return self._keyframes
+
+async def run_probe(*args):
+    proc = await create_subprocess_exec("ffprobe", "-v", "error", *args, stdout=PIPE, stderr=PIPE)
+    stdout, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        LOGS.error(f"FFProbe Failed: {stderr.decode().strip()}")
+        return None
+    return stdout.decode()
+
+class MediaProber:
+    def __init__(self, max_items=64):
+        self.__max_items = max_items
+        self.__cache = OrderedDict()
+        self.__locks = {}
+
+    @staticmethod
+    def __key(path):
+        # Keyed by inode so hardlinked views of one source share a single probe
+        st = stat(path)
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+    async def probe(self, path):
+        """Memoised per file version, concurrent callers for the same file share one ffprobe run"""
+        try:
+            key = self.__key(path)
+        except OSError:
+            return None
+        lock = self.__locks.setdefault(key, Lock())
+        async with lock:
+            if (info := self.__cache.get(key)) is None:
+                if not (out := await run_probe("-print_format", "json", "-show_format", "-show_streams", path)):
+                    # Not cached, a later call probes again
+                    self.__locks.pop(key, None)
+                    return None
+                try:
+                    info = MediaInfo(path, await sync_to_async(jloads, out, pool='cpu'))
+                except Exception as e:
+                    LOGS.error(f"Media Probe Parse Failed: {e}")
+                    return None
+                self.__cache[key] = info
+                while len(self.__cache) > self.__max_items:
+                    old_key, _ = self.__cache.popitem(last=False)
+                    self.__locks.pop(old_key, None)
+            self.__cache.move_to_end(key)
+        if not ospath.exists(info.path):
+            info.path = path
+        return info
+
+prober = MediaProber()
+
+async def probe(path):
+    return await prober.probe(path)
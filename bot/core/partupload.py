@@ -0,0 +1,130 @@
+from os import path as ospath
+from math import ceil
+from asyncio import Queue, Lock, gather, create_task, sleep as asleep
+
+from pyrogram import raw, utils
+from pyrogram.types import Message
+from pyrogram.session import Session
+from pyrogram.errors import FloodWait
+
+from bot import Var, LOGS
+from .func_utils import sync_to_async
+from .mediaprobe import probe
+from .tgdispatch import tgd
+
+PART_SIZE = 512 * 1024  # MTProto maximum
+BIG_FILE_SIZE = 10 * 1024 * 1024
+
+def read_part(path, index):
+    with open(path, 'rb') as f:
+        f.seek(index * PART_SIZE)
+        return f.read(PART_SIZE)
+
+async def video_attributes(path):
+    if not (info := await probe(path)):
+        return []
+    return [raw.types.DocumentAttributeVideo(duration=int(info.duration), w=info.width, h=info.height, supports_streaming=True)]
+
+class ParallelUploader:
+    """Uploads file parts over a pool of media sessions with a bounded in-flight window, each part retried on its own"""
+    def __init__(self, sessions=4, window=8, retries=5):
+        self.__size = max(1, sessions)
+        self.__window = max(1, window)
+        self.__retries = retries
+        self.__sessions = []
+        self.__lock = Lock()
+
+    async def __pool(self, client):
+        async with self.__lock:
+            if not self.__sessions:
+                dc_id, auth_key, test_mode = await client.storage.dc_id(), await client.storage.auth_key(), await client.storage.test_mode()
+                for _ in range(self.__size):
+                    session = Session(client, dc_id, auth_key, test_mode, is_media=True)
+                    await session.start()
+                    self.__sessions.append(session)
+                LOGS.info(f"Upload Session Pool Started with {self.__size} Session(s) !!")
+        return self.__sessions
+
+    async def close(self):
+        async with self.__lock:
+            for session in self.__sessions:
+                try:
+                    await session.stop()
+                except Exception as e:
+                    LOGS.error(f"Upload Session Stop Failed: {e}")
+            self.__sessions = []
+
+    async def save_file(self, client, path, progress=None):
+        """Returns the InputFile / InputFileBig referencing the uploaded parts"""
+        size = ospath.getsize(path)
+        total_parts = max(1, ceil(size / PART_SIZE))
+        is_big = size > BIG_FILE_SIZE
+        file_id = client.rnd_id()
+        sessions = await self.__pool(client)
+        parts, done = Queue(), [0]
+        for index in range(total_parts):
+            parts.put_nowait(index)
+
+        async def send_part(session, index):
+            chunk = await sync_to_async(read_part, path, index)
+            if is_big:
+                query = raw.functions.upload.SaveBigFilePart(file_id=file_id, file_part=index, file_total_parts=total_parts, bytes=chunk)
+            else:
+                query = raw.functions.upload.SaveFilePart(file_id=file_id, file_part=index, bytes=chunk)
+            for attempt in range(self.__retries + 1):
+                try:
+                    if await session.invoke(query):
+                        break
+                except FloodWait as e:
+                    await asleep(e.value * 1.2)
+                except Exception as e:
+                    if attempt >= self.__retries:
+                        raise
+                    LOGS.warning(f"Upload Part {index}/{total_parts} Failed: {e!r}, Retrying...")
+                    await asleep(min(2 ** attempt, 30))
+            else:
+                raise RuntimeError(f"Upload Part {index} of {ospath.basename(path)} Rejected")
+            done[0] += len(chunk)
+            if progress:
+                await progress(done[0], size)
+
+        async def worker(n):
+            # Workers are spread over the sessions, the window bounds how many parts are in flight
+            session = sessions[n % len(sessions)]
+            while not parts.empty():
+                await send_part(session, parts.get_nowait())
+
+        workers = [create_task(worker(n)) for n in range(min(self.__window, total_parts))]
+        try:
+            await gather(*workers)
+        except BaseException:
+            for task in workers:
+                task.cancel()
+            raise
+        name = ospath.basename(path)
+        if is_big:
+            return raw.types.InputFileBig(id=file_id, parts=total_parts, name=name)
+        return raw.types.InputFile(id=file_id, parts=total_parts, name=name, md5_checksum="")
+
+    async def send_document(self, client, chat_id, path, caption="", thumb=None, attributes=None, progress=None):
+        """send_document / send_video equivalent on top of the parallel part upload"""
+        file = await self.save_file(client, path, progress)
+        media = raw.types.InputMediaUploadedDocument(
+            mime_type=client.guess_mime_type(path) or "application/zip",
+            file=file,
+            thumb=await client.save_file(thumb) if thumb else None,
+            force_file=not attributes,
+            attributes=[raw.types.DocumentAttributeFilename(file_name=ospath.basename(path)), *(attributes or [])],
+        )
+        r = await tgd.call(chat_id, client.invoke, raw.functions.messages.SendMedia(
+            peer=await client.resolve_peer(chat_id),
+            media=media,
+            random_id=client.rnd_id(),
+            **await utils.parse_text_entities(client, caption, None, None),
+        ))
+        users, chats = {u.id: u for u in r.users}, {c.id: c for c in r.chats}
+        for upd in r.updates:
+            if isinstance(upd, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+                return await Message._parse(client, upd.message, users, chats)
+
+uploader = ParallelUploader(Var.UPLOAD_SESSIONS, Var.UPLOAD_WINDOW, Var.UPLOAD_RETRIES)
@@ -0,0 +1,85 @@
+from time import time
+from collections import deque
+from asyncio import sleep as asleep
+
+from bot import bot_loop
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.__updated = time()
+
+    def __refill(self):
+        now = time()
+        self.tokens = min(self.capacity, self.tokens + (now - self.__updated) * self.rate)
+        self.__updated = now
+
+    def delay(self):
+        self.__refill()
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.__refill()
+        self.tokens -= 1
+
+    def drain(self, tokens):
+        self.__refill()
+        self.tokens = min(self.tokens, tokens)
+
+class PriorityLimiter:
+    HIGH, LOW = 0, 1
+
+    def __init__(self, rate, capacity):
+        self.__bucket = TokenBucket(rate, capacity)
+        self.__waiters = (deque(), deque())
+        self.__blocked_until = 0
+        self.__task = None
+        self.waited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def acquire(self, priority=LOW):
+        start = time()
+        fut = bot_loop.create_future()
+        self.__waiters[priority].append(fut)
+        if self.__task is None or self.__task.done():
+            self.__task = bot_loop.create_task(self.__dispatch())
+        await fut
+        if (wait := time() - start) > 0.01:
+            self.waited += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        return wait
+
+    async def __dispatch(self):
+        while any(self.__waiters):
+            if (delay := max(self.__blocked_until - time(), self.__bucket.delay())) > 0:
+                # Re-pick after sleeping so a late high priority caller jumps the queue
+                await asleep(delay)
+                continue
+            queue = self.__waiters[self.HIGH] or self.__waiters[self.LOW]
+            fut = queue.popleft()
+            if not fut.done():
+                self.__bucket.take()
+                fut.set_result(None)
+
+    def block(self, seconds):
+        self.__blocked_until = max(self.__blocked_until, time() + seconds)
+
+    def update(self, remaining=None, reset=None):
+        if remaining is None:
+            return
+        self.__bucket.drain(remaining)
+        if remaining <= 1 and reset:
+            self.__blocked_until = max(self.__blocked_until, reset)
+
+    def stats(self):
+        return {
+            'queued': sum(map(len, self.__waiters)),
+            'waited': self.waited,
+            'avg_wait': round(self.total_wait / (self.waited or 1), 3),
+            'max_wait': round(self.max_wait, 3),
+            'total_wait': round(self.total_wait, 3),
+        }
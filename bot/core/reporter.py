@@ -1,12 +1,17 @@
-from time import sleep
-from pyrogram.errors import FloodWait
-from bot import Var, LOGS, bot
+from asyncio import wait
+
+from bot import Var, LOGS, bot, bot_loop
+from .tgdispatch import tgd, LOW
 
 class Reporter:
-    def __init__(self, client, chat_id, log):
+    def __init__(self, client, chat_id, log, max_pending=50):
         self.__client = client
         self.__cid = chat_id
         self.__logger = log
+        self.__max_pending = max_pending
+        # Held until done, the loop only keeps weak references to its tasks
+        self.__tasks = set()
+        self.dropped = 0
 
     async def report(self, msg, log_type, log=True):
         txt = [f"[{log_type.upper()}] {msg}", log_type.lower()]
@@ -19,12 +24,24 @@ class Reporter:
         else:
             self.__logger.info(txt[0])
         if log and self.__cid != 0:
-            try:
-                await self.__client.send_message(self.__cid, f"{txt[0][:4096]}")
-            except FloodWait as f:
-                self.__logger.warning(str(f))
-                sleep(f.value * 1.5)
-            except Exception as err:
-                self.__logger.error(str(err))
+            # Sent in the background so callers never wait on the log channel, and dropped while
+            # its lane is parked by a FloodWait or backed up, the line is already in the log file
+            if tgd.parked(self.__cid) or len(self.__tasks) >= self.__max_pending:
+                self.dropped += 1
+                return
+            task = bot_loop.create_task(self.__send(txt[0]))
+            self.__tasks.add(task)
+            task.add_done_callback(self.__tasks.discard)
+
+    async def __send(self, text):
+        try:
+            await tgd.call(self.__cid, self.__client.send_message, self.__cid, text[:4096], priority=LOW, retries=0)
+        except Exception as err:
+            self.__logger.error(str(err))
+
+    async def flush(self, timeout=10):
+        """Waits a little for pending reports, used before the process is replaced"""
+        if self.__tasks:
+            await wait(list(self.__tasks), timeout=timeout)
 
 rep = Reporter(bot, Var.LOG_CHANNEL, LOGS)
@@ -0,0 +1,62 @@
+from re import search
+from time import time
+from json import loads as jloads, dumps as jdumps
+from os import path as ospath, replace as osreplace
+from collections import OrderedDict
+
+from aiofiles import open as aiopen
+
+from bot import Var, LOGS
+
+SEEN_FILE = "seen.json"
+
+def item_key(link):
+    if (infohash := search(r"urn:btih:([A-Za-z0-9]+)", link or "")):
+        return infohash.group(1).lower()
+    return (link or "").strip()
+
+class SeenIndex:
+    def __init__(self, path, max_items=5000, max_age=30*86400):
+        self.__path = path
+        self.__max_items = max_items
+        self.__max_age = max_age
+        self.__items = OrderedDict()
+        self.__load()
+
+    def __load(self):
+        if not ospath.exists(self.__path):
+            return
+        try:
+            with open(self.__path) as f:
+                self.__items = OrderedDict(jloads(f.read()))
+        except Exception as e:
+            LOGS.error(f"Seen Index Load Failed: {e}")
+        self.__prune()
+
+    def __prune(self):
+        expiry = time() - self.__max_age
+        while self.__items and (len(self.__items) > self.__max_items or next(iter(self.__items.values())) < expiry):
+            self.__items.popitem(last=False)
+
+    def __len__(self):
+        return len(self.__items)
+
+    def __contains__(self, link):
+        return item_key(link) in self.__items
+
+    async def add(self, link):
+        key = item_key(link)
+        if not key:
+            return
+        self.__items[key] = time()
+        self.__items.move_to_end(key)
+        self.__prune()
+        await self.save()
+
+    async def save(self):
+        tmp_path = f"{self.__path}.tmp"
+        async with aiopen(tmp_path, "w") as f:
+            await f.write(jdumps(list(self.__items.items())))
+        osreplace(tmp_path, self.__path)
+
+seen = SeenIndex(SEEN_FILE, Var.SEEN_MAX_ITEMS, Var.SEEN_MAX_AGE)
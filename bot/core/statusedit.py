@@ -0,0 +1,70 @@
+from time import time
+from asyncio import sleep as asleep
+
+from bot import Var, LOGS, bot_loop
+from .func_utils import editMessage
+from .tgdispatch import tgd, LOW
+
+class StatusEditor:
+    """Coalesces edits of live status messages, only the newest text of each message is kept
+    and sent at most once per interval, unchanged text is never sent"""
+    def __init__(self, interval=10):
+        self.__interval = interval
+        self.__states = {}
+        self.requested = 0
+        self.sent = 0
+
+    @staticmethod
+    def __key(msg):
+        return (msg.chat.id, msg.id)
+
+    async def update(self, msg, text, final=False):
+        """final flushes right away, used for states the message settles in"""
+        if not msg:
+            return
+        self.requested += 1
+        key = self.__key(msg)
+        if (st := self.__states.get(key)) is None:
+            st = self.__states[key] = {'msg': msg, 'text': None, 'sent': None, 'at': 0.0, 'task': None}
+        st['text'] = text
+        if final or not self.__interval:
+            if st['task'] is not None:
+                st['task'].cancel()
+                st['task'] = None
+            await self.__flush(key)
+        elif st['task'] is None:
+            st['task'] = bot_loop.create_task(self.__later(key, max(0, st['at'] + self.__interval - time())))
+
+    async def __later(self, key, delay):
+        await asleep(delay)
+        if (st := self.__states.get(key)) is not None:
+            st['task'] = None
+            await self.__flush(key)
+
+    async def __flush(self, key):
+        if (st := self.__states.get(key)) is None or st['text'] == st['sent']:
+            return
+        text, st['at'] = st['text'], time()
+        try:
+            await editMessage(st['msg'], text, priority=LOW)
+            st['sent'] = text
+            self.sent += 1
+        except Exception as e:
+            LOGS.error(f"Status Edit Failed: {e}")
+
+    async def close(self, msg, delete=True):
+        """Drops whatever is still pending for msg and deletes it"""
+        if not msg:
+            return
+        if (st := self.__states.pop(self.__key(msg), None)) and st['task'] is not None:
+            st['task'].cancel()
+        if delete:
+            try:
+                await tgd.call(msg.chat.id, msg.delete, priority=LOW)
+            except Exception as e:
+                LOGS.error(f"Status Delete Failed: {e}")
+
+    def stats(self):
+        return {'messages': len(self.__states), 'requested': self.requested, 'sent': self.sent}
+
+status = StatusEditor(Var.STATUS_INTERVAL)
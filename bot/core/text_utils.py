@@ -1,13 +1,15 @@
 from calendar import month_name
 from datetime import datetime
 from random import choice
-from asyncio import sleep as asleep
-from aiohttp import ClientSession
+from asyncio import gather
 from anitopy import parse
 from bot import Var, bot
 from .ffencoder import ffargs
 from .func_utils import handle_logs
 from .reporter import rep
+from .anicache import anicache, search_key
+from .ratelimit import PriorityLimiter
+from .httpclient import http
 
 CAPTION_FORMAT = """
 <b>㊂  <i>{title}</i></b>
@@ -46,9 +48,7 @@ GENRES_EMOJI = {
     "Thriller": choice(['🥶', '🔪', '🤯'])
 }
 
-ANIME_GRAPHQL_QUERY = """
-query ($id: Int, $search: String, $seasonYear: Int) {
-  Media(id: $id, type: ANIME, format_not_in: [MOVIE, MUSIC, MANGA, NOVEL, ONE_SHOT], search: $search, seasonYear: $seasonYear) {
+ANIME_MEDIA_FIELDS = """
     id
     title {
       romaji
@@ -71,15 +71,29 @@ query ($id: Int, $search: String, $seasonYear: Int) {
     status
     description
     siteUrl
-  }
-}
 """
 
+ANIME_MEDIA_FILTER = "type: ANIME, format_not_in: [MOVIE, MUSIC, MANGA, NOVEL, ONE_SHOT]"
+
+ANIME_GRAPHQL_QUERY = f"""
+query ($id: Int, $search: String, $seasonYear: Int) {{
+  Media(id: $id, {ANIME_MEDIA_FILTER}, search: $search, seasonYear: $seasonYear) {{{ANIME_MEDIA_FIELDS}  }}
+}}
+"""
+
+def batch_graphql_query(count):
+    args = ", ".join(f"$s{i}: String, $y{i}: Int" for i in range(count))
+    medias = "".join(f"  a{i}: Media({ANIME_MEDIA_FILTER}, search: $s{i}, seasonYear: $y{i}) {{{ANIME_MEDIA_FIELDS}  }}\n" for i in range(count))
+    return f"query ({args}) {{\n{medias}}}"
+
+ANILIST_API = "https://graphql.anilist.co"
+anilimiter = PriorityLimiter(Var.ANI_RATE_LIMIT / 60, Var.ANI_RATE_BURST)
+
 class AniLister:
-    def __init__(self, anime_name: str, year: int) -> None:
-        self.__api = "https://graphql.anilist.co"
+    def __init__(self, anime_name: str, year: int, priority=PriorityLimiter.HIGH) -> None:
         self.__ani_name = anime_name
         self.__ani_year = year
+        self.__priority = priority
         self.__vars = {'search': self.__ani_name, 'seasonYear': self.__ani_year}
 
     def __update_vars(self, year=True) -> None:
@@ -89,10 +103,28 @@ class AniLister:
         else:
             self.__vars = {'search': self.__ani_name}
 
+    @staticmethod
+    async def post_query(query, variables, priority=PriorityLimiter.LOW, retries=3):
+        for _ in range(retries):
+            await anilimiter.acquire(priority)
+            async with http.post(ANILIST_API, json={'query': query, 'variables': variables}) as resp:
+                res_code, res_heads = resp.status, resp.headers
+                try:
+                    resp_json = await resp.json(content_type=None)
+                except ValueError:
+                    # HTML error pages and the like, callers treat the answer as unknown
+                    resp_json = None
+            if (remaining := res_heads.get('X-RateLimit-Remaining')) is not None:
+                anilimiter.update(int(remaining), int(res_heads.get('X-RateLimit-Reset') or 0))
+            if res_code != 429:
+                break
+            f_timer = int(res_heads.get('Retry-After', 5))
+            anilimiter.block(f_timer)
+            await rep.report(f"AniList API FloodWait: {res_code}, Pausing Requests for {f_timer} seconds!", "error")
+        return res_code, resp_json, res_heads
+
     async def post_data(self):
-        async with ClientSession() as sess:
-            async with sess.post(self.__api, json={'query': ANIME_GRAPHQL_QUERY, 'variables': self.__vars}) as resp:
-                return (resp.status, await resp.json(), resp.headers)
+        return await self.post_query(ANIME_GRAPHQL_QUERY, self.__vars, self.__priority)
 
     async def get_anidata(self):
         res_code, resp_json, res_heads = await self.post_data()
@@ -106,18 +138,45 @@ class AniLister:
             self.__update_vars(year=False)
             res_code, resp_json, res_heads = await self.post_data()
 
-        if res_code == 200:
-            return resp_json.get('data', {}).get('Media', {})
+        if res_code == 200 and resp_json:
+            return (resp_json.get('data') or {}).get('Media') or {}
 
-        elif res_code == 429:
-            f_timer = int(res_heads.get('Retry-After', 5))
-            await rep.report(f"AniList API FloodWait: {res_code}, Sleeping for {f_timer} seconds!", "error")
-            await asleep(f_timer)
-            return await self.get_anidata()
+        elif res_code == 404:
+            return {}
 
         else:
+            # Not a real miss, None keeps the failed lookup out of the cache
             await rep.report(f"AniList API Error: {res_code}", "error", log=False)
+            return None
+
+    @classmethod
+    async def post_batch(cls, searches, priority=PriorityLimiter.LOW):
+        """searches are (name, seasonYear) pairs, only the ones AniList actually answered are returned"""
+        variables = {}
+        for i, (name, year) in enumerate(searches):
+            variables[f's{i}'], variables[f'y{i}'] = name, year
+        res_code, resp_json, _ = await cls.post_query(batch_graphql_query(len(searches)), variables, priority)
+        if res_code not in (200, 404) or not (data := (resp_json or {}).get('data')):
+            await rep.report(f"AniList Batch API Error: {res_code}", "error", log=False)
             return {}
+        # Unmatched aliases come back as null with a 404 error, a null alias with any other error stays unknown
+        errors = {err['path'][0]: err.get('status') for err in (resp_json.get('errors') or []) if err.get('path')}
+        results = {}
+        for i, search in enumerate(searches):
+            if media := data.get(f'a{i}'):
+                results[search] = media
+            elif errors.get(f'a{i}', 404) == 404:
+                results[search] = {}
+        return results
+
+    @classmethod
+    async def search_many(cls, searches, priority=PriorityLimiter.LOW):
+        searches = list(dict.fromkeys(searches))
+        chunks = [searches[i:i + Var.ANI_BATCH_SIZE] for i in range(0, len(searches), Var.ANI_BATCH_SIZE)]
+        results = {}
+        for chunk_res in await gather(*(cls.post_batch(chunk, priority) for chunk in chunks)):
+            results.update(chunk_res)
+        return results
 
 class TextEditor:
     def __init__(self, name):
@@ -125,16 +184,75 @@ class TextEditor:
         self.adata = {}
         self.pdata = parse(name)
 
-    async def load_anilist(self):
-        cache_names = []
+    @property
+    def cache_key(self):
+        return search_key(self.pdata.get("anime_title"), self.pdata.get("anime_season"), self.pdata.get("anime_year"))
+
+    async def load_anilist(self, priority=PriorityLimiter.HIGH):
+        ckey = self.cache_key
+        if (cached := await anicache.get_search(ckey)) is not None:
+            self.adata = cached
+            return
+        cache_names, failed = [], False
         for option in [(False, False), (False, True), (True, False), (True, True)]:
             ani_name = await self.parse_name(*option)
             if ani_name in cache_names:
                 continue
             cache_names.append(ani_name)
-            self.adata = await AniLister(ani_name, datetime.now().year).get_anidata()
+            if (adata := await AniLister(ani_name, datetime.now().year, priority).get_anidata()) is None:
+                failed = True
+                continue
+            self.adata = adata
             if self.adata:
                 break
+        # A miss is only cached when every variant was answered with a real not found
+        if self.adata or not failed:
+            await anicache.set_search(ckey, self.adata)
+
+    @staticmethod
+    async def load_anilist_many(editors, priority=PriorityLimiter.LOW):
+        pending = []
+        for editor in editors:
+            if (cached := await anicache.get_search(editor.cache_key)) is not None:
+                editor.adata = cached
+            else:
+                pending.append(editor)
+        lookups = list(pending)
+
+        # Same order as AniLister.get_anidata, every name variant from this seasonYear back to 2020, then without one
+        this_year = datetime.now().year
+        years = [*range(this_year, min(this_year, 2020) - 1, -1), None]
+        tried = {id(editor): set() for editor in pending}
+        failed = set()
+        for option in [(False, False), (False, True), (True, False), (True, True)]:
+            names = {}
+            for editor in pending:
+                ani_name = await editor.parse_name(*option)
+                if not ani_name or ani_name in tried[id(editor)]:
+                    continue
+                tried[id(editor)].add(ani_name)
+                names[id(editor)] = ani_name
+            for year in years:
+                searches = {}
+                for editor in pending:
+                    if id(editor) in names:
+                        searches.setdefault((names[id(editor)], year), []).append(editor)
+                if not searches:
+                    break
+                results = await AniLister.search_many(searches.keys(), priority)
+                for search, ani_editors in searches.items():
+                    for editor in ani_editors:
+                        if search not in results:
+                            # Like the live path, an error ends this variant and the next one is tried
+                            failed.add(id(editor))
+                            names.pop(id(editor), None)
+                        editor.adata = results.get(search) or {}
+                pending = [editor for editor in pending if not editor.adata]
+
+        for editor in lookups:
+            # Lookups hit by an API error stay uncached unless another variant resolved them
+            if editor.adata or id(editor) not in failed:
+                await anicache.set_search(editor.cache_key, editor.adata)
 
     @handle_logs
     async def parse_name(self, no_s=False, no_y=False):
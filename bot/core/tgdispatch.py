@@ -0,0 +1,65 @@
+from time import time
+
+from pyrogram.errors import FloodWait
+
+from bot import Var, LOGS
+from .ratelimit import PriorityLimiter
+
+HIGH, LOW = PriorityLimiter.HIGH, PriorityLimiter.LOW
+
+class TgDispatcher:
+    """Single gate for Bot API calls, a global bucket for the bot plus one lane per chat,
+    a FloodWait only parks the lane of the chat that got it"""
+    def __init__(self, global_rate=30, chat_rate=1, group_rate=20 / 60, retries=3, max_lanes=1024):
+        self.__global = PriorityLimiter(global_rate, global_rate)
+        self.__chat_rate = chat_rate
+        self.__group_rate = group_rate
+        self.__retries = retries
+        self.__max_lanes = max_lanes
+        self.__lanes = {}
+        self.__parked = {}
+        self.calls = 0
+        self.retried = 0
+        self.floodwaits = 0
+        self.failed = 0
+
+    def __lane(self, chat_id):
+        if (lane := self.__lanes.get(chat_id)) is None:
+            if len(self.__lanes) >= self.__max_lanes:
+                for cid in [cid for cid, l in self.__lanes.items() if not l.stats()['queued']]:
+                    self.__lanes.pop(cid, None)
+                    self.__parked.pop(cid, None)
+            # Groups and channels allow about 20 messages a minute, private chats about one a second
+            group = isinstance(chat_id, int) and chat_id < 0
+            lane = self.__lanes[chat_id] = PriorityLimiter(self.__group_rate if group else self.__chat_rate, 3 if group else 1)
+        return lane
+
+    async def call(self, chat_id, func, *args, priority=HIGH, retries=None, **kwargs):
+        retries = self.__retries if retries is None else retries
+        lane = self.__lane(chat_id)
+        for attempt in range(retries + 1):
+            await lane.acquire(priority)
+            await self.__global.acquire(priority)
+            self.calls += 1
+            try:
+                return await func(*args, **kwargs)
+            except FloodWait as f:
+                self.floodwaits += 1
+                lane.block(f.value * 1.2)
+                self.__parked[chat_id] = time() + f.value * 1.2
+                LOGS.warning(f"FloodWait of {f.value}s on Chat {chat_id}, Parking its Queue...")
+                if attempt >= retries:
+                    self.failed += 1
+                    raise
+                self.retried += 1
+
+    def parked(self, chat_id):
+        return self.__parked.get(chat_id, 0) > time()
+
+    def stats(self):
+        now = time()
+        parked = {cid: round(until - now) for cid, until in self.__parked.items() if until > now}
+        return {'calls': self.calls, 'retried': self.retried, 'floodwaits': self.floodwaits, 'failed': self.failed,
+                'lanes': len(self.__lanes), 'parked': parked, 'global': self.__global.stats()}
+
+tgd = TgDispatcher(Var.TG_GLOBAL_RATE, retries=Var.TG_RETRIES)
@@ -1,45 +1,48 @@
-from time import time, sleep
+from time import time
 from traceback import format_exc
 from math import floor
 from os import path as ospath
 from aiofiles.os import remove as aioremove
-from pyrogram.errors import FloodWait
 
 from bot import bot, Var
-from .func_utils import editMessage, sendMessage, convertBytes, convertTime
+from .func_utils import sendMessage, convertBytes, convertTime
 from .reporter import rep
+from .partupload import uploader, video_attributes, BIG_FILE_SIZE
+from .tgdispatch import tgd
+from .statusedit import status
 
 class TgUploader:
-    def __init__(self, message):
+    def __init__(self, message, job=None):
         self.cancelled = False
         self.message = message
+        self.__job = job
         self.__name = ""
         self.__qual = ""
         self.__client = bot
         self.__start = time()
-        self.__updater = time()
-
-        # ✅ Ensure TOTAL_QUALS is set correctly
-        if not hasattr(Var, "TOTAL_QUALS"):
-            Var.TOTAL_QUALS = Var.QUALS.copy()
 
     async def upload(self, path, qual):
+        if not path or not ospath.exists(path):  # ✅ Prevent retrying missing files
+            raise FileNotFoundError(f"{qual} Output Missing: {path}")
+
         self.__name = ospath.basename(path)
         self.__qual = qual
 
-        if not ospath.exists(path):  # ✅ Prevent retrying missing files
-            await rep.report(f"[ERROR] File missing: {path}", "error")
-            return  
-
         try:
-            if qual.lower() == "hdrip":  # ✅ Mark HDRip as processed before upload
-                if qual in Var.QUALS:
-                    Var.QUALS.remove(qual)
-                self.update_progress()
-
+            if self.__tier:
+                self.__tier.enter('uploading')
             msg = None
-            if Var.AS_DOC:
-                msg = await self.__client.send_document(
+            if Var.UPLOAD_SESSIONS and ospath.getsize(path) > BIG_FILE_SIZE:
+                # Parts go out over several media sessions at once, a failed part is retried alone
+                msg = await uploader.send_document(
+                    self.__client, Var.FILE_STORE, path,
+                    caption=f"<i>{self.__name}</i>",
+                    thumb="thumb.jpg" if ospath.exists("thumb.jpg") else None,
+                    attributes=None if Var.AS_DOC else await video_attributes(path),
+                    progress=self.progress_status
+                )
+            elif Var.AS_DOC:
+                msg = await tgd.call(Var.FILE_STORE, self.__client.send_document,
                     chat_id=Var.FILE_STORE,
                     document=path,
                     thumb="thumb.jpg" if ospath.exists("thumb.jpg") else None,
@@ -48,7 +51,7 @@ class TgUploader:
                     progress=self.progress_status
                 )
             else:
-                msg = await self.__client.send_video(
+                msg = await tgd.call(Var.FILE_STORE, self.__client.send_video,
                     chat_id=Var.FILE_STORE,
                     video=path,  
                     thumb="thumb.jpg" if ospath.exists("thumb.jpg") else None,
@@ -57,16 +60,12 @@ class TgUploader:
                 )
 
             if msg is None or not hasattr(msg, "id"):  # ✅ Fix "NoneType" error
-                await rep.report(f"[ERROR] Upload failed for: {path}", "error")
-                return
-
-            if qual in Var.QUALS:  # ✅ Remove only after successful upload
-                Var.QUALS.remove(qual)
-            self.update_progress()
+                raise RuntimeError(f"Upload Failed for: {path}")
 
-        except FloodWait as e:
-            sleep(e.value * 1.5)
-            return await self.upload(path, qual)
+            if self.__tier:
+                self.__tier.enter('uploaded')
+            await self.update_progress()
+            return msg
 
         except Exception as e:
             await rep.report(format_exc(), "error")
@@ -81,17 +80,16 @@ class TgUploader:
             self.__client.stop_transmission()
         now = time()
         diff = now - self.__start
-        if (now - self.__updater) >= 7 or current == total:
-            self.__updater = now
-            percent = round(current / total * 100, 2)
-            speed = current / diff
-            eta = round((total - current) / speed)
-            bar = floor(percent / 8) * "█" + (12 - floor(percent / 8)) * "▒"
+        percent = round(current / total * 100, 2)
+        speed = current / diff if diff else 0
+        eta = round((total - current) / speed) if speed else 0
+        bar = floor(percent / 8) * "█" + (12 - floor(percent / 8)) * "▒"
 
-            completed = len(Var.TOTAL_QUALS) - len(Var.QUALS)  # ✅ Ensure correct count
-            total_qualities = len(Var.TOTAL_QUALS)  
+        if self.__tier:
+            self.__tier.progress(current, total)
+        completed, total_qualities = self.__counts()
 
-            progress_str = f"""‣ <b>Anime Name :</b> <b><i>{self.__name}</i></b>
+        progress_str = f"""‣ <b>Anime Name :</b> <b><i>{self.__name}</i></b>
 
 ‣ <b>Status :</b> <i>Uploading</i>
     <code>[{bar}]</code> {percent}%
@@ -103,12 +101,20 @@ class TgUploader:
 
 ‣ <b>File(s) Encoded:</b> <code>{completed} / {total_qualities}</code>"""
 
-            await editMessage(self.message, progress_str)
+        await status.update(self.message, progress_str, final=current == total)
 
-    def update_progress(self):
-        """ ✅ Correct encoded file count logic """
-        completed = len(Var.TOTAL_QUALS) - len(Var.QUALS)
-        total_qualities = len(Var.TOTAL_QUALS)  
+    async def update_progress(self):
+        completed, total_qualities = self.__counts()
 
         progress_str = f"‣ <b>File(s) Encoded:</b> <code>{completed} / {total_qualities}</code>"
-        editMessage(self.message, progress_str)
\ No newline at end of file
+        await status.update(self.message, progress_str)
+
+    @property
+    def __tier(self):
+        return self.__job.tiers.get(self.__qual) if self.__job else None
+
+    def __counts(self):
+        # Counted from this job's own tiers, an upload outside a job counts as one file
+        if self.__job:
+            return self.__job.completed, self.__job.total
+        return 0, 1
@@ -1,43 +1,369 @@
-from os import path as ospath
+from os import path as ospath, makedirs, remove
+from json import load as jload, dump as jdump, JSONDecodeError
+from time import time
+from asyncio import sleep as asleep, shield
 from aiofiles import open as aiopen
 from aiofiles.os import path as aiopath, remove as aioremove, mkdir
 
-from aiohttp import ClientSession
-from torrentp import TorrentDownloader
-from bot import LOGS
+import libtorrent as lt
+from bot import Var, LOGS, bot_loop
 from bot.core.func_utils import handle_logs
+from bot.core.httpclient import http
+
+class TorrentJob:
+    def __init__(self, handle, save_path, name=None, progress=None):
+        self.handle = handle
+        self.save_path = save_path
+        self.name = name
+        self.on_progress = progress
+        self.future = bot_loop.create_future()
+        self.start_time = time()
+
+    @property
+    def info_hash(self):
+        return str(self.handle.info_hash())
+
+    def status(self):
+        st = self.handle.status()
+        return {
+            'name': st.name or self.name,
+            'progress': round(st.progress * 100, 2),
+            'done': st.total_wanted_done,
+            'total': st.total_wanted,
+            'speed': st.download_rate,
+            'peers': st.num_peers,
+            'seeds': st.num_seeds,
+            'state': str(st.state),
+            'elapsed': time() - self.start_time,
+        }
+
+class TorrentSession:
+    """One long-lived libtorrent session shared by every download"""
+    def __init__(self, state_dir="torrents"):
+        self.__ses = None
+        self.__state_path = ospath.join(state_dir, "session.state")
+        self.__resume_dir = ospath.join(state_dir, "resume")
+        self.__manifest_path = ospath.join(state_dir, "manifest.json")
+        self.__manifest = self.__load_manifest()
+        self.__jobs = {}
+        self.__task = None
+        self.__resume_saved = time()
+
+    @staticmethod
+    def __settings():
+        return {
+            'listen_interfaces': '0.0.0.0:6881,[::]:6881',
+            'enable_dht': True,
+            'enable_lsd': True,
+            'enable_upnp': True,
+            'enable_natpmp': True,
+            'active_downloads': Var.TORRENT_ACTIVE,
+            'active_seeds': 0,
+            'active_limit': Var.TORRENT_ACTIVE,
+            'download_rate_limit': Var.TORRENT_DL_LIMIT * 1024,
+            'upload_rate_limit': Var.TORRENT_UL_LIMIT * 1024,
+            'alert_mask': lt.alert.category_t.status_notification | lt.alert.category_t.error_notification | lt.alert.category_t.storage_notification,
+        }
+
+    @property
+    def session(self):
+        if self.__ses is None:
+            self.__ses = lt.session(self.__settings())
+            if ospath.exists(self.__state_path):
+                try:
+                    with open(self.__state_path, 'rb') as f:
+                        self.__ses.load_state(lt.bdecode(f.read()))
+                    LOGS.info("Torrent Session State Loaded !!")
+                except Exception as e:
+                    LOGS.error(f"Torrent Session State Load Failed: {e}")
+        return self.__ses
+
+    def __load_manifest(self):
+        try:
+            with open(self.__manifest_path) as f:
+                return jload(f)
+        except (FileNotFoundError, JSONDecodeError):
+            return {}
+
+    def __save_manifest(self):
+        makedirs(ospath.dirname(self.__manifest_path), exist_ok=True)
+        with open(self.__manifest_path, 'w') as f:
+            jdump(self.__manifest, f, indent=4)
+
+    def __resume_path(self, info_hash):
+        return ospath.join(self.__resume_dir, f"{info_hash}.fastresume")
+
+    def pending(self):
+        """Downloads that were interrupted by a restart or crash"""
+        return [dict(info_hash=ih, **job) for ih, job in self.__manifest.items()]
+
+    def content_paths(self):
+        """Paths on disk still owned by interrupted downloads"""
+        return [ospath.join(job['save_path'], job['content']) for job in self.__manifest.values() if job.get('content')]
+
+    @staticmethod
+    def __params_hash(params):
+        if params.ti is not None:
+            return str(params.ti.info_hash())
+        if hasattr(params, 'info_hashes'):
+            return str(params.info_hashes.v1)
+        return str(params.info_hash)
+
+    async def add(self, source, save_path, name=None, progress=None, link=None, sequential=False):
+        if source.startswith("magnet:"):
+            params = lt.parse_magnet_uri(source)
+        else:
+            params = lt.add_torrent_params()
+            params.ti = lt.torrent_info(source)
+        info_hash = self.__params_hash(params)
+
+        if (job := self.__jobs.get(info_hash)):
+            return job
+
+        if ospath.exists(resume_path := self.__resume_path(info_hash)):
+            try:
+                with open(resume_path, 'rb') as f:
+                    resumed = lt.read_resume_data(f.read())
+                if resumed.ti is None:
+                    resumed.ti = params.ti
+                params = resumed
+                LOGS.info(f"Resuming Torrent from Saved Pieces: {name or info_hash}")
+            except Exception as e:
+                LOGS.error(f"Torrent Resume Data Invalid, Starting Fresh: {e}")
+        params.save_path = save_path
+        handle = self.session.add_torrent(params)
+        if Var.TORRENT_PER_DL_LIMIT:
+            handle.set_download_limit(Var.TORRENT_PER_DL_LIMIT * 1024)
+        if sequential:
+            handle.set_flags(lt.torrent_flags.sequential_download)
+
+        # content is the top level file / folder the torrent writes, known once metadata is in
+        content = params.ti.name() if params.ti is not None else None
+        self.__manifest[info_hash] = {'name': name, 'link': link or source, 'save_path': save_path, 'content': content, 'added': time()}
+        self.__save_manifest()
+
+        job = TorrentJob(handle, save_path, name, progress)
+        self.__jobs[info_hash] = job
+        if self.__task is None or self.__task.done():
+            self.__task = bot_loop.create_task(self.__loop())
+        return job
+
+    async def wait(self, job):
+        """Waits for the torrent to finish and returns the downloaded file/folder name"""
+        try:
+            # A cancelled waiter leaves the job in the manifest, so it resumes on next start
+            return await shield(job.future)
+        finally:
+            if job.future.done():
+                self.__drop(job)
+
+    def cancel(self, job):
+        """Stops a torrent for good, its manifest entry, resume data and files are removed"""
+        if not job.future.done():
+            job.future.cancel()
+        self.__drop(job)
+
+    def __drop(self, job):
+        info_hash = job.info_hash
+        self.__jobs.pop(info_hash, None)
+        self.__manifest.pop(info_hash, None)
+        self.__save_manifest()
+        if ospath.exists(resume_path := self.__resume_path(info_hash)):
+            remove(resume_path)
+        try:
+            # A failed torrent never hands its files to anyone, the partial data goes with it
+            failed = job.future.cancelled() or job.future.exception() is not None
+            self.session.remove_torrent(job.handle, lt.session.delete_files if failed else 0)
+        except Exception:
+            pass
+
+    def __finish(self, job, result=None, error=None):
+        if job.future.done():
+            return
+        if error is not None:
+            job.future.set_exception(error)
+        else:
+            job.future.set_result(result)
+
+    def __save_resume(self, handle):
+        if handle.is_valid() and handle.need_save_resume_data():
+            handle.save_resume_data(lt.save_resume_flags_t.save_info_dict)
+            return True
+        return False
+
+    def __process_alerts(self):
+        saved = 0
+        for alert in self.session.pop_alerts():
+            if not (handle := getattr(alert, 'handle', None)) or not handle.is_valid():
+                continue
+            info_hash = str(handle.info_hash())
+            if isinstance(alert, lt.save_resume_data_alert):
+                saved += 1
+                if info_hash not in self.__manifest:
+                    continue
+                makedirs(self.__resume_dir, exist_ok=True)
+                with open(self.__resume_path(info_hash), 'wb') as f:
+                    f.write(lt.write_resume_data_buf(alert.params))
+            elif isinstance(alert, lt.save_resume_data_failed_alert):
+                saved += 1
+            elif isinstance(alert, lt.metadata_received_alert):
+                if (entry := self.__manifest.get(info_hash)) is not None:
+                    entry['content'] = handle.torrent_file().name()
+                    self.__save_manifest()
+            elif not (job := self.__jobs.get(info_hash)):
+                continue
+            elif isinstance(alert, lt.torrent_finished_alert):
+                self.__finish(job, handle.status().name)
+            elif isinstance(alert, lt.torrent_error_alert):
+                self.__finish(job, error=RuntimeError(alert.message()))
+        return saved
+
+    async def __loop(self):
+        while self.__jobs:
+            self.__process_alerts()
+            if time() - self.__resume_saved >= Var.TORRENT_RESUME_INTERVAL:
+                self.__resume_saved = time()
+                for job in self.__jobs.values():
+                    self.__save_resume(job.handle)
+
+            for job in list(self.__jobs.values()):
+                if job.future.done():
+                    continue
+                st = job.handle.status()
+                if st.is_finished or st.is_seeding:
+                    self.__finish(job, st.name)
+                elif job.on_progress:
+                    try:
+                        await job.on_progress(job.status())
+                    except Exception as e:
+                        LOGS.error(f"Torrent Progress Callback Failed: {e}")
+            await asleep(1)
+
+    async def close(self, timeout=10):
+        if self.__ses is None:
+            return
+        self.__ses.pause()
+        requested = sum(self.__save_resume(job.handle) for job in self.__jobs.values())
+        saved, deadline = 0, time() + timeout
+        while saved < requested and time() < deadline:
+            saved += self.__process_alerts()
+            await asleep(0.2)
+        try:
+            makedirs(ospath.dirname(self.__state_path), exist_ok=True)
+            with open(self.__state_path, 'wb') as f:
+                f.write(lt.bencode(self.__ses.save_state()))
+        except Exception as e:
+            LOGS.error(f"Torrent Session State Save Failed: {e}")
+
+torsession = TorrentSession()
+
+class PieceReader:
+    """File-like reader over the largest file of a torrent that is still downloading,
+    each read blocks until the pieces backing the requested range are verified"""
+    def __init__(self, job, lookahead=8):
+        self.job = job
+        self.path = None
+        self.size = 0
+        self.pos = 0
+        self.__lookahead = lookahead
+        self.__file = None
+
+    async def open(self):
+        handle = self.job.handle
+        while not handle.status().has_metadata:
+            if self.job.future.cancelled():
+                raise RuntimeError(f"Torrent Cancelled Before Metadata: {self.job.name}")
+            if self.job.future.done() and self.job.future.exception():
+                raise self.job.future.exception()
+            await asleep(0.5)
+        self.__ti = handle.torrent_file()
+        files = self.__ti.files()
+        self.__index = max(range(files.num_files()), key=files.file_size)
+        self.path = ospath.join(self.job.save_path, files.file_path(self.__index))
+        self.size = files.file_size(self.__index)
+        self.__offset = files.file_offset(self.__index)
+        self.__piece_len = self.__ti.piece_length()
+        return self
+
+    async def __wait_pieces(self, first, last):
+        handle = self.job.handle
+        for n, piece in enumerate(range(first, min(last + self.__lookahead, self.__ti.num_pieces() - 1) + 1)):
+            handle.set_piece_deadline(piece, (n + 1) * 1000)
+        done, since = handle.status().total_wanted_done, time()
+        while not all(handle.have_piece(piece) for piece in range(first, last + 1)):
+            if self.job.future.cancelled():
+                raise RuntimeError(f"Torrent Cancelled While Streaming: {self.job.name}")
+            if self.job.future.done() and self.job.future.exception():
+                raise self.job.future.exception()
+            if (now_done := handle.status().total_wanted_done) != done:
+                done, since = now_done, time()
+            elif Var.STREAM_STALL_TIMEOUT and time() - since > Var.STREAM_STALL_TIMEOUT:
+                # A dead swarm would otherwise hold the encode slot forever
+                raise TimeoutError(f"Torrent Stalled for {Var.STREAM_STALL_TIMEOUT}s While Streaming: {self.job.name}")
+            await asleep(0.25)
+
+    async def read(self, size=1 << 20):
+        if self.pos >= self.size:
+            return b""
+        size = min(size, self.size - self.pos)
+        start = self.__offset + self.pos
+        await self.__wait_pieces(start // self.__piece_len, (start + size - 1) // self.__piece_len)
+        if self.__file is None:
+            self.__file = await aiopen(self.path, 'rb')
+        await self.__file.seek(self.pos)
+        data = await self.__file.read(size)
+        self.pos += len(data)
+        return data
+
+    async def close(self):
+        if self.__file is not None:
+            await self.__file.close()
+            self.__file = None
 
 class TorDownloader:
     def __init__(self, path="."):
         self.__downdir = path
         self.__torpath = "torrents/"
-    
+        self.info_hash = None
+
+    @handle_logs
+    async def download(self, torrent, name=None, progress=None):
+        if (job := await self.start(torrent, name, progress)):
+            return await self.finish(job)
+
     @handle_logs
-    async def download(self, torrent, name=None):
+    async def start(self, torrent, name=None, progress=None, sequential=False):
+        job = None
         if torrent.startswith("magnet:"):
-            torp = TorrentDownloader(torrent, self.__downdir)
-            await torp.start_download()
-            return ospath.join(self.__downdir, name)
+            job = await torsession.add(torrent, self.__downdir, name, progress, torrent, sequential)
         elif torfile := await self.get_torfile(torrent):
-            torp = TorrentDownloader(torfile, self.__downdir)
-            await torp.start_download()
-            await aioremove(torfile)
-            return ospath.join(self.__downdir, torp._torrent_info._info.name())
+            try:
+                job = await torsession.add(torfile, self.__downdir, name, progress, torrent, sequential)
+            finally:
+                await aioremove(torfile)
+        if job:
+            self.info_hash = job.info_hash
+        return job
+
+    @handle_logs
+    async def finish(self, job):
+        return ospath.join(self.__downdir, await torsession.wait(job) or job.name)
+
+    def cancel(self, job):
+        torsession.cancel(job)
 
     @handle_logs
     async def get_torfile(self, url):
         if not await aiopath.isdir(self.__torpath):
             await mkdir(self.__torpath)
-        
+
         tor_name = url.split('/')[-1]
         des_dir = ospath.join(self.__torpath, tor_name)
-        
-        async with ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status == 200:
-                    async with aiopen(des_dir, 'wb') as file:
-                        async for chunk in response.content.iter_any():
-                            await file.write(chunk)
-                    return des_dir
+
+        async with http.get(url) as response:
+            if response.status == 200:
+                async with aiopen(des_dir, 'wb') as file:
+                    async for chunk in response.content.iter_any():
+                        await file.write(chunk)
+                return des_dir
         return None
-        
\ No newline at end of file
@@ -1,71 +0,0 @@
-import asyncio
-import json
-
-import os
-import subprocess
-import math
-import re
-
-from pathlib import Path
-
-import aiofiles
-import aiohttp
-
-OK = {}
-
-
-async def genss(file):
-    process = subprocess.Popen(
-        ["mediainfo", file, "--Output=JSON"],
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-    )
-    stdout, stderr = process.communicate()
-    out = stdout.decode().strip()
-    z = json.loads(out)
-    p = z["media"]["track"][0]["Duration"]
-    return int(p.split(".")[-2])
-
-
-async def duration_s(file):
-    tsec = await genss(file)
-    x = round(tsec / 5)
-    y = round(tsec / 5 + 30)
-    pin = convertTime(x)
-    if y < tsec:
-        pon = convertTime(y)
-    else:
-        pon = convertTime(tsec)
-    return pin, pon
-
-
-async def gen_ss_sam(hash, filename, log):
-    try:
-        ss_path, sp_path = None, None
-        os.mkdir(hash)
-        tsec = await genss(filename)
-        fps = 10 / tsec
-        ncmd = f"ffmpeg -i '{filename}' -vf fps={fps} -vframes 10 '{hash}/pic%01d.png'"
-        process = await asyncio.create_subprocess_shell(
-            ncmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-        )
-        await process.communicate()
-        ss, dd = await duration_s(filename)
-        __ = filename.split(".mkv")[-2]
-        out = __ + "_sample.mkv"
-        _ncmd = f'ffmpeg -i """{filename}""" -preset ultrafast -ss {ss} -to {dd} -c:v copy -crf 27 -map 0:v -c:a aac -map 0:a -c:s copy -map 0:s? """{out}""" -y'
-        process = await asyncio.create_subprocess_shell(
-            _ncmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await process.communicate()
-        er = stderr.decode().strip()
-        try:
-            if er:
-                if not os.path.exists(out) or os.path.getsize(out) == 0:
-                    log.error(str(er))
-                    return (ss_path, sp_path)
-        except Exception:
-            print(e)
-        return hash, out
-    except Exception as err:
-        log.error(str(err))
@@ -1,7 +1,7 @@
 from asyncio import sleep as asleep, gather
 from pyrogram.filters import command, private, user
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
-from pyrogram.errors import FloodWait, MessageNotModified
+from pyrogram.errors import MessageNotModified
 from pyrogram import Client, filters
 
 from bot import bot, bot_loop, Var, ani_cache
@@ -12,6 +12,13 @@ from bot.core.func_utils import (
 )
 from bot.core.auto_animes import get_animes
 from bot.core.reporter import rep
+from bot.core.executors import executors
+from bot.core.text_utils import anilimiter
+from bot.core.tgdispatch import tgd
+from bot.core.statusedit import status
+from bot.core.encpool import encpool
+from bot.core.ffencoder import encode_jobs
+from bot.core.jobstate import live_jobs
 from bot.core.channel_manager import anime_channels, save_channels # ✅ Import fixed
 
 OWNER_ID = Var.OWNER_ID  # ✅ Ensure OWNER_ID is properly set
@@ -127,6 +134,38 @@ async def resume_fetch(client, message):  # ✅ Fixed duplicate function name
 async def _log(client, message):
     await message.reply_document("log.txt", quote=True)
 
+@bot.on_message(command('stats') & private & user(Var.ADMINS))
+@new_task
+async def _stats(client, message):
+    txt = "<b>Executor Pools :</b>\n"
+    for name, pstats in executors.stats().items():
+        txt += f"\n‣ <b>{name.upper()}</b> ({pstats['kind']}, {pstats['workers']} workers)\n"
+        txt += f"    <i>Inflight:</i> {pstats['inflight']} | <i>Queued:</i> {pstats['queued']} | <i>Done:</i> {pstats['completed']}\n"
+        txt += f"    <i>Wait:</i> {pstats['avg_wait']}s avg, {pstats['max_wait']}s max | <i>Run:</i> {pstats['avg_run']}s avg\n"
+    estats = encpool.stats()
+    txt += f"\n<b>Encode Pool :</b>\n    <i>Slots:</i> {estats['slots']} | <i>Running:</i> {estats['running']} | <i>Queued:</i> {estats['queued']}\n"
+    for ejob in encode_jobs.values():
+        ej = ejob.stats()
+        txt += f"    ‣ <i>{ej['name']}</i> [{ej['qual']}] {ej['percent']}% @ {ej['speed']}x, {ej['fps']} fps, ETA {convertTime(ej['eta']) or '-'}\n"
+    if live_jobs:
+        txt += f"\n<b>Live Jobs :</b> {len(live_jobs)}\n"
+    for job in live_jobs.values():
+        js = job.stats()
+        txt += f"    ‣ <i>{js['name']}</i> {js['completed']} / {js['total']} Tiers, {convertTime(js['elapsed'])}\n"
+        txt += "        " + " | ".join(f"{t['qual']}: {t['stage']}" for t in js['tiers']) + "\n"
+    lstats = anilimiter.stats()
+    txt += f"\n<b>AniList Limiter :</b>\n    <i>Queued:</i> {lstats['queued']} | <i>Throttled:</i> {lstats['waited']} calls, {lstats['total_wait']}s total\n"
+    txt += f"    <i>Wait:</i> {lstats['avg_wait']}s avg, {lstats['max_wait']}s max\n"
+    tstats = tgd.stats()
+    txt += f"\n<b>Telegram Dispatcher :</b>\n    <i>Calls:</i> {tstats['calls']} | <i>FloodWaits:</i> {tstats['floodwaits']} | <i>Retried:</i> {tstats['retried']} | <i>Failed:</i> {tstats['failed']}\n"
+    txt += f"    <i>Lanes:</i> {tstats['lanes']} | <i>Queued:</i> {tstats['global']['queued']}\n"
+    sstats = status.stats()
+    txt += f"    <i>Status Edits:</i> {sstats['sent']} sent of {sstats['requested']} requested, {sstats['messages']} live\n"
+    txt += f"    <i>Log Reports Dropped:</i> {rep.dropped}\n"
+    for cid, left in tstats['parked'].items():
+        txt += f"    ‣ <i>Parked</i> <code>{cid}</code> for {convertTime(left)}\n"
+    await sendMessage(message, txt)
+
 @bot.on_message(command('addlink') & private & user(Var.ADMINS))
 @new_task
 async def add_link(client, message):  # ✅ Renamed function for clarity
@@ -1,30 +1,39 @@
 from json import loads as jloads
-from os import path as ospath, execl
+from os import path as ospath, execl, kill
+from signal import SIGKILL
 from sys import executable
 
-from aiohttp import ClientSession
-from bot import Var, bot, ffQueue
+from bot import Var, bot, LOGS, ffpids_cache
 from bot.core.text_utils import TextEditor
 from bot.core.reporter import rep
+from bot.core.httpclient import http
+from bot.core.tordownload import torsession
+from bot.core.partupload import uploader
 
 async def upcoming_animes():
     if Var.SEND_SCHEDULE:
         try:
-            async with ClientSession() as ses:
-                res = await ses.get("https://subsplease.org/api/?f=schedule&h=true&tz=Asia/Kolkata")
+            async with http.get("https://subsplease.org/api/?f=schedule&h=true&tz=Asia/Kolkata") as res:
                 aniContent = jloads(await res.text())["schedule"]
             text = "<b>📆 Today's Anime Releases Schedule [IST]</b>\n\n"
-            for i in aniContent:
-                aname = TextEditor(i["title"])
-                await aname.load_anilist()
+            anames = [TextEditor(i["title"]) for i in aniContent]
+            await TextEditor.load_anilist_many(anames)
+            for i, aname in zip(aniContent, anames):
                 text += f''' <a href="https://subsplease.org/shows/{i['page']}">{aname.adata.get('title', {}).get('english') or i['title']}</a>\n    • <b>Time</b> : {i["time"]} hrs\n\n'''
             TD_SCHR = await bot.send_message(Var.MAIN_CHANNEL, text)
             await (await TD_SCHR.pin()).delete()
         except Exception as err:
             await rep.report(str(err), "error")
-    if not ffQueue.empty():
-        await ffQueue.join()
+    # Running jobs are checkpointed in the job store and resume from their last stage after the restart
     await rep.report("Auto Restarting..!!", "info")
+    await rep.flush()
+    await torsession.close()
+    await uploader.close()
+    for pid in ffpids_cache:
+        try:
+            kill(pid, SIGKILL)
+        except (OSError, ProcessLookupError):
+            LOGS.error("Killing Process Failed !!")
     execl(executable, executable, "-m", "bot")
 
 async def update_shdr(name, link):